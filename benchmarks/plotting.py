@@ -0,0 +1,58 @@
+# per plot latency of the visualisation functions against the fast FigureTemplates mode
+# usage: python -m benchmarks.plotting [--cametra_path PATH] [--tracklets N]
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+from src.multiframe import visualisation
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.visualisation import FigureTemplates
+
+PATH = 'unittests/input_files/cametra_interface_output.tsv'
+
+
+def _get_parameters():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cametra_path', action='store', default=PATH, help='path to OD camera file, .tsv')
+    parser.add_argument('--tracklets', action='store', type=int, default=5, help='number of longest tracklets to plot')
+    parser.add_argument('--dpi', action='store', type=int, default=None, help='dpi of the fast plots')
+    parser.add_argument('--scale', action='store', type=float, default=1.0, help='figure size factor of the fast plots')
+    return parser.parse_args()
+
+
+def plot_jobs(tracklets, path):
+    jobs = []
+    for tracklet in tracklets:
+        jobs.extend(tracklet.graphs_jobs(path))
+        jobs.append(('plot_derivatives', (tracklet.ages, tracklet.lat_dist, 'lat_dist', f'{path}/lat_dist_derivatives.png')))
+    return jobs
+
+
+def measure(plotter, jobs):
+    latency = {}
+    for function, job_args in jobs:
+        start = time.perf_counter()
+        getattr(plotter, function)(*job_args)
+        latency.setdefault(function, []).append(time.perf_counter() - start)
+    return {function: 1000 * np.mean(values) for function, values in latency.items()}
+
+
+def run(args):
+    tracklets = MFParser(pd.read_csv(args.cametra_path, sep='\t')).apply()
+    tracklets = sorted(tracklets, key=len)[-args.tracklets:]
+    with tempfile.TemporaryDirectory() as path:
+        jobs = plot_jobs(tracklets, path)
+        current = measure(visualisation, jobs)
+        templates = FigureTemplates(dpi=args.dpi, scale=args.scale)
+        fast = measure(templates, jobs)
+        templates.close()
+    print(f'{"function":<25}{"current [ms]":>15}{"fast [ms]":>15}{"speedup":>10}')
+    for function in current:
+        print(f'{function:<25}{current[function]:>15.1f}{fast[function]:>15.1f}{current[function] / fast[function]:>10.1f}')
+
+
+if __name__ == "__main__":
+    run(_get_parameters())
@@ -0,0 +1,137 @@
+# scaling benchmark of parsing, detection and plotting on synthetic cametra logs, results are written as json
+# usage: python -m benchmarks.suite [--rows 10000 100000 1000000] [--output PATH] [--compare PATH]
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+from src.multiframe import visualisation
+from src.multiframe.mf_parser import MFParser
+from benchmarks.plotting import plot_jobs
+from benchmarks.synthetic import write_cametra
+
+ROWS = [10000, 100000, 1000000]
+# a stage slower than this factor of the compared run is reported as a regression
+REGRESSION_FACTOR = 1.2
+
+
+def _get_parameters():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', action='store', type=int, nargs='+', default=ROWS, help='sizes of the synthetic logs')
+    parser.add_argument('--uids', action='store', type=int, default=100, help='number of uids visible at every frame')
+    parser.add_argument('--tracklet_length', action='store', type=int, default=50, help='mean tracklet length')
+    parser.add_argument('--uid_reuse', action='store', type=float, default=0.5, help='probability of uid reuse')
+    parser.add_argument('--anomaly_rate', action='store', type=float, default=0.05, help='fraction of anomalous tracks')
+    parser.add_argument('--plots', action='store', type=int, default=5, help='number of tracklets to plot per size')
+    parser.add_argument('--output', action='store', default=None, help='json results path, default benchmarks/results/<commit>.json')
+    parser.add_argument('--compare', action='store', default=None, help='json results of a previous run')
+    return parser.parse_args()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def measure(function, setup, items):
+    # time a first run, then repeat on a fresh setup under tracemalloc for the peak memory
+    arg = setup()
+    start = time.perf_counter()
+    function(arg)
+    seconds = time.perf_counter() - start
+    arg = setup()
+    tracemalloc.start()
+    function(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'items': items, 'items_per_second': items / seconds if seconds else None,
+            'peak_memory_mb': peak / 2 ** 20}
+
+
+def _physical(tracklets):
+    for tracklet in tracklets:
+        tracklet.physical_anomaly()
+
+
+def _derivatives(tracklets):
+    for tracklet in tracklets:
+        tracklet.derivatives_anomaly()
+
+
+def _plots(jobs):
+    for function, job_args in jobs:
+        getattr(visualisation, function)(*job_args)
+
+
+def run_size(rows, args, path):
+    cametra_path = os.path.join(path, f'cametra_{rows}.tsv')
+    write_cametra(cametra_path, rows=rows, uids=args.uids, tracklet_length=args.tracklet_length,
+                  uid_reuse=args.uid_reuse, anomaly_rate=args.anomaly_rate)
+    df = pd.read_csv(cametra_path, sep='\t')
+    results = {'read_csv': measure(lambda _: pd.read_csv(cametra_path, sep='\t'), lambda: None, rows),
+               'MFParser.apply': measure(lambda frame: MFParser(frame).apply(), lambda: df, rows)}
+    tracklets = lambda: MFParser(df).apply()
+    results['physical_anomaly'] = measure(_physical, tracklets, rows)
+    results['derivatives_anomaly'] = measure(_derivatives, tracklets, rows)
+
+    # plots do not depend on the file size, throughput is in plots per second
+    longest = sorted(MFParser(df).apply(), key=len)[-args.plots:]
+    jobs = plot_jobs(longest, path)
+    for function in dict(jobs):
+        function_jobs = [job for job in jobs if job[0] == function]
+        results[f'visualisation.{function}'] = measure(_plots, lambda: function_jobs, len(function_jobs))
+    return results
+
+
+def compare(results, previous):
+    regressions = []
+    for rows, stages in results['results'].items():
+        for stage, result in stages.items():
+            old = previous['results'].get(rows, {}).get(stage)
+            if old is None:
+                continue
+            # throughputs, the number of plotted tracklets may differ between runs
+            ratio = old['items_per_second'] / result['items_per_second']
+            print(f'{rows:>10}  {stage:<40}{old["items_per_second"]:>14.1f}{result["items_per_second"]:>14.1f}{ratio:>8.2f}')
+            if ratio > REGRESSION_FACTOR:
+                regressions.append((rows, stage, ratio))
+    return regressions
+
+
+def run(args):
+    results = {'revision': git_revision(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+               'platform': platform.platform(), 'parameters': vars(args), 'results': {}}
+    with tempfile.TemporaryDirectory() as path:
+        for rows in args.rows:
+            results['results'][str(rows)] = run_size(rows, args, path)
+            for stage, result in results['results'][str(rows)].items():
+                print(f'{rows:>10}  {stage:<40}{result["seconds"]:>10.3f} s{result["items_per_second"]:>14.0f} /s'
+                      f'{result["peak_memory_mb"]:>10.1f} MB')
+    output = args.output or os.path.join('benchmarks', 'results', f'{results["revision"]}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {output}')
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for rows, stage, ratio in regressions:
+            print(f'Regression: {stage} at {rows} rows is {ratio:.2f} times slower')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(_get_parameters()))
@@ -0,0 +1,156 @@
+# synthetic cametra logs with every column read by Tracklet
+# usage: python -m benchmarks.synthetic OUTPUT_PATH [--rows N] [--uids N] [--tracklet_length N] [--anomaly_rate P]
+import argparse
+import numpy as np
+import pandas as pd
+from src.multiframe.mf_stream import CAMETRA_DTYPES
+
+# microseconds between frames, like the recorded logs
+FRAME_STEP = 100000
+FIRST_FRAME = 1687017793399806
+# label -> (world width, world height, sub classes)
+LABEL_SIZES = {0: (0.6, 1.7, [0]), 1: (0.7, 1.6, [0, 1]), 2: (1.9, 1.5, [1, 2, 3]), 3: (0.5, 0.5, [0])}
+LABELS = [0, 1, 2, 3]
+LABEL_PROBABILITIES = [0.3, 0.2, 0.4, 0.1]
+
+
+def _track_lengths(num_frames, tracklet_length, rng):
+    # back to back tracks of one uid slot, covering num_frames frames
+    lengths = []
+    total = 0
+    while total < num_frames:
+        length = int(rng.integers(max(tracklet_length // 2, 3), tracklet_length * 3 // 2 + 1))
+        lengths.append(length)
+        total += length
+    return lengths
+
+
+def generate_cametra(rows=10000, uids=100, tracklet_length=50, uid_reuse=0.5, anomaly_rate=0.05, seed=0):
+    # uids tracks are visible at every frame, each slot runs consecutive tracks of about tracklet_length frames.
+    # With probability uid_reuse a track keeps the uid of the previous track of its slot, so the age vector of
+    # that uid resets under the same label. A fraction anomaly_rate of the tracks get one injected anomaly: a world
+    # height spike for label 0, a longitudinal velocity sign flip for label 2 and a lateral distance spike otherwise
+    if rows < 1 or uids < 1 or tracklet_length < 1:
+        raise ValueError('rows, uids and tracklet_length must be positive')
+    if not (0 <= uid_reuse <= 1 and 0 <= anomaly_rate <= 1):
+        raise ValueError('uid_reuse and anomaly_rate are probabilities')
+    rng = np.random.default_rng(seed)
+    num_frames = -(-rows // uids)
+    slot, frame, age, track = [], [], [], []
+    track_uids, reused = [], []
+    next_uid = 0
+    for s in range(uids):
+        offset = 0
+        for i, length in enumerate(_track_lengths(num_frames, tracklet_length, rng)):
+            reused.append(i > 0 and rng.random() < uid_reuse)
+            if not reused[-1]:
+                uid = next_uid
+                next_uid += 1
+            track.append(np.full(length, len(track_uids)))
+            track_uids.append(uid)
+            slot.append(np.full(length, s))
+            frame.append(np.arange(offset, offset + length))
+            age.append(np.arange(1, length + 1))
+            offset += length
+    slot, frame, age, track = (np.concatenate(values) for values in [slot, frame, age, track])
+    # rows of a frame are consecutive in the file
+    order = np.lexsort((slot, frame))
+    order = order[frame[order] < num_frames][:rows]
+    frame, age, track = frame[order], age[order], track[order]
+    n = len(order)
+    num_tracks = len(track_uids)
+
+    labels = rng.choice(LABELS, size=num_tracks, p=LABEL_PROBABILITIES)
+    # a reused uid keeps the label of the previous track of its slot
+    for i in np.flatnonzero(reused):
+        labels[i] = labels[i - 1]
+    sizes = np.array([LABEL_SIZES[label][:2] for label in labels])
+    sub_classes = np.array([rng.choice(LABEL_SIZES[label][2]) for label in labels])
+    label = labels[track]
+
+    # smooth kinematics, constant velocity per track plus measurement noise
+    lat_start, long_start = rng.uniform(-20, 20, num_tracks), rng.uniform(5, 80, num_tracks)
+    vel_x, vel_z = rng.normal(0, 0.5, num_tracks), rng.normal(5, 4, num_tracks)
+    t = 0.1 * (age - 1)
+    abs_vel_x = vel_x[track] + rng.normal(0, 0.05, n)
+    abs_vel_z = vel_z[track] + rng.normal(0, 0.05, n)
+    lat_dist = lat_start[track] + vel_x[track] * t + rng.normal(0, 0.02, n)
+    long_dist = long_start[track] + vel_z[track] * t + rng.normal(0, 0.02, n)
+    world_width = sizes[track, 0] + rng.normal(0, 0.02, n)
+    world_height = sizes[track, 1] + rng.normal(0, 0.02, n)
+
+    # anomaly on a random row of a track after convergence
+    anomalous = np.flatnonzero(rng.random(num_tracks) < anomaly_rate)
+    candidates = np.flatnonzero(np.isin(track, anomalous) & (age >= 12))
+    _, first = np.unique(track[candidates], return_index=True)
+    injected = candidates[first]
+    for row in injected:
+        if label[row] == 0:
+            world_height[row] = 3.0
+        elif label[row] == 2:
+            abs_vel_z[row] = -np.sign(abs_vel_z[row] or 1) * max(abs(abs_vel_z[row]), 3)
+        else:
+            lat_dist[row] += 2.0
+
+    width = 4000 * world_width / long_dist.clip(1)
+    height = 4000 * world_height / long_dist.clip(1)
+    df = pd.DataFrame({
+        'name': FIRST_FRAME + FRAME_STEP * frame,
+        'label': label,
+        'sub_class': sub_classes[track],
+        'uid': np.array(track_uids)[track],
+        'age': age,
+        'score': rng.uniform(50, 100, n),
+        'world_width': world_width,
+        'world_height': world_height,
+        'lat_dist': lat_dist,
+        'long_dist': long_dist,
+        'abs_vel_x': abs_vel_x,
+        'abs_vel_z': abs_vel_z,
+        'abs_acc_x': rng.normal(0, 0.1, n),
+        'abs_acc_z': rng.normal(0, 0.1, n),
+        'rel_vel_x': abs_vel_x - 0.1,
+        'rel_vel_z': abs_vel_z - 10,
+        'rel_acc_x': rng.normal(0, 0.1, n),
+        'rel_acc_z': rng.normal(0, 0.1, n),
+        'orientation': rng.uniform(-np.pi, np.pi, num_tracks)[track],
+        'lane_association': rng.integers(-1, 2, num_tracks)[track],
+        'is_cipv': ((label == 2) & (np.abs(lat_dist) < 1.5)).astype(int),
+        'is_occluded': (rng.random(n) < 0.05).astype(int),
+        'x_center': 960 + 40 * lat_dist / long_dist.clip(1),
+        'y_center': 540 + 10 * rng.normal(0, 1, n),
+        'width': width,
+        'height': height,
+        'd3_separation': width / 2,
+        'sf_confirmed': (age > 3).astype(int),
+    })
+    if list(df.columns) != list(CAMETRA_DTYPES):
+        raise ValueError('the synthetic columns do not match CAMETRA_DTYPES')
+    df.attrs['injected_rows'] = injected
+    return df
+
+
+def write_cametra(path, **kwargs):
+    df = generate_cametra(**kwargs)
+    df.to_csv(path, sep='\t', index=False, float_format='%.4f')
+    return df
+
+
+def _get_parameters():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_path', action='store', help='path of the generated .tsv file')
+    parser.add_argument('--rows', action='store', type=int, default=10000, help='number of rows')
+    parser.add_argument('--uids', action='store', type=int, default=100, help='number of uids visible at every frame')
+    parser.add_argument('--tracklet_length', action='store', type=int, default=50, help='mean tracklet length')
+    parser.add_argument('--uid_reuse', action='store', type=float, default=0.5,
+                        help='probability that a new track keeps the uid of the previous one (negative age reset)')
+    parser.add_argument('--anomaly_rate', action='store', type=float, default=0.05,
+                        help='fraction of the tracks with an injected anomaly')
+    parser.add_argument('--seed', action='store', type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _get_parameters()
+    write_cametra(args.output_path, rows=args.rows, uids=args.uids, tracklet_length=args.tracklet_length,
+                  uid_reuse=args.uid_reuse, anomaly_rate=args.anomaly_rate, seed=args.seed)
@@ -1,5 +1,6 @@
 import argparse
-from src.multiframe.mf_analyzer import MFAnalyzer
+# light import, the analysis modules are only imported once the arguments are parsed
+from src.multiframe.mf_output import OUTPUT_FORMATS
 
 def _get_parameters():
     parser = argparse.ArgumentParser()
@@ -7,15 +8,85 @@ def _get_parameters():
                         default=None, help='path to OD camera file, .tsv')
     parser.add_argument('--output_dir', action='store',required=False,
                         default=None, help='path to output directory')
-    return parser.parse_args()
+    parser.add_argument('--batch', action='store',
+                        default=None, help='directory or glob of OD camera files, analyzed into --output_dir')
+    parser.add_argument('--jobs', action='store', type=int,
+                        default=1, help='number of files analyzed in parallel in batch mode')
+    parser.add_argument('--workers', action='store', type=int,
+                        default=1, help='number of processes rendering the plots')
+    parser.add_argument('--fast_plots', action='store_true',
+                        help='reuse figure templates instead of building a figure per plot')
+    parser.add_argument('--plot_dpi', action='store', type=int,
+                        default=None, help='dpi of the fast plots')
+    parser.add_argument('--plot_scale', action='store', type=float,
+                        default=1.0, help='figure size factor of the fast plots')
+    parser.add_argument('--stream', action='store_true',
+                        help='read the cametra file in chunks and analyze tracklets as soon as they are closed')
+    parser.add_argument('--chunksize', action='store', type=int,
+                        default=100000, help='number of rows per chunk in stream mode')
+    parser.add_argument('--idle_frames', action='store', type=int,
+                        default=None, help='close a tracklet after this many frames without its uid in stream mode, '
+                                           'IDLE_FRAMES of mf_stream by default')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap detection and writes with a producer thread and a writer thread pool, '
+                             'parsing is overlapped too with --stream')
+    parser.add_argument('--writers', action='store', type=int,
+                        default=4, help='number of writer threads in pipeline mode')
+    parser.add_argument('--queue_size', action='store', type=int,
+                        default=8, help='number of tracklet batches buffered between the pipeline stages')
+    parser.add_argument('--batch_size', action='store', type=int,
+                        default=256, help='number of tracklets per batch in pipeline mode')
+    parser.add_argument('--cache_dir', action='store',
+                        default=None, help='directory of the parsed cametra caches, files are not cached without it')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='do not read or write the parsed cametra cache even with --cache_dir')
+    parser.add_argument('--rebuild_cache', action='store_true',
+                        help='parse the cametra file again and rewrite its cache')
+    parser.add_argument('--output_format', action='store', choices=OUTPUT_FORMATS,
+                        default='directories', help='tsv per flagged tracklet and stage, consolidated tables, or both')
+    parser.add_argument('--table_format', action='store', choices=['parquet', 'tsv'],
+                        default=None, help='format of the consolidated tables, parquet when pyarrow is installed')
+    parser.add_argument('--no_plots', '--no-plots', action='store_true',
+                        help='do not render any plot, matplotlib is never imported')
+    parser.add_argument('--profile', action='store_true',
+                        help='write a cProfile of the run to the output directory')
+    parser.add_argument('--trace_memory', action='store_true',
+                        help='trace allocations with tracemalloc, peak and top allocations go to metrics.json')
+    parser.add_argument('--fleet_stats', action='store',
+                        default=None, help='json file of the world height and second derivative distributions of all logs')
+    parser.add_argument('--update_fleet_stats', action='store_true',
+                        help='add the distributions of the analyzed logs to the fleet_stats file')
+    parser.add_argument('--fleet_thresholds', action='store_true',
+                        help='use the population thresholds of the fleet_stats file in the detectors')
+    parser.add_argument('--result_cache', action='store',
+                        default=None, help='directory of the detector results and plots reused by later runs')
+    parser.add_argument('--result_cache_size', action='store', type=float,
+                        default=2048, help='size of the result cache in MB, least recently used entries are evicted')
+    args = parser.parse_args()
+    if args.batch is not None and args.output_dir is None:
+        parser.error('--batch needs --output_dir')
+    if (args.update_fleet_stats or args.fleet_thresholds) and args.fleet_stats is None:
+        parser.error('--update_fleet_stats and --fleet_thresholds need --fleet_stats')
+    return args
 
 def run(args):
-    mfa = MFAnalyzer(args.cametra_path, output_dir=args.output_dir)
-    mfa.save_tracklets_with_physical_anomalies()
-    mfa.save_tracklets_with_derivatives_anomalies()
-    mfa.analyze_cipv()
+    from src.multiframe.mf_batch import analyze_file, run_batch
+    options = dict(workers=args.workers, fast_plots=args.fast_plots, plot_dpi=args.plot_dpi,
+                   plot_scale=args.plot_scale, stream=args.stream, chunksize=args.chunksize,
+                   idle_frames=args.idle_frames, cache=not args.no_cache, cache_dir=args.cache_dir,
+                   rebuild_cache=args.rebuild_cache,
+                   profile=args.profile, trace_memory=args.trace_memory, output_format=args.output_format,
+                   table_format=args.table_format, no_plots=args.no_plots, pipeline=args.pipeline,
+                   writers=args.writers, queue_size=args.queue_size, batch_size=args.batch_size,
+                   fleet_stats=args.fleet_stats, update_fleet_stats=args.update_fleet_stats,
+                   fleet_thresholds=args.fleet_thresholds, result_cache=args.result_cache,
+                   result_cache_size=args.result_cache_size)
+    if args.batch is not None:
+        run_batch(args.batch, args.output_dir, args.jobs, **options)
+    else:
+        analyze_file(args.cametra_path, output_dir=args.output_dir, **options)
     
 
 if __name__ == "__main__":
     args = _get_parameters()
-    run(args)
\ No newline at end of file
+    run(args)
@@ -0,0 +1,112 @@
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+
+class Metrics:
+    # named timers and counters of a run, timers accumulate the calls and the seconds spent.
+    # Updates are locked, writer threads of the pipeline share the registry
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        # decorator version of timer
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_time(self, name, seconds, calls=1):
+        with self.lock:
+            timer = self.timers.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            timer['calls'] += calls
+            timer['seconds'] += seconds
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, timers, counters):
+        # timers and counters of another process
+        for name, timer in timers.items():
+            self.add_time(name, timer['seconds'], timer['calls'])
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def count_file(self, path):
+        # one written output file and its size
+        self.count('files_written')
+        self.count('bytes_written', os.path.getsize(path))
+
+    def to_dict(self):
+        return {'wall_seconds': time.perf_counter() - self.start,
+                'timers': dict(sorted(self.timers.items())),
+                'counters': dict(sorted(self.counters.items()))}
+
+
+# metrics of the current run, shared like the "mf_analyser" logger and reset by every MFAnalyzer
+metrics = Metrics()
+
+
+class Profiler:
+    # optional cProfile and tracemalloc capture of a run, written next to metrics.json
+    def __init__(self, cpu=False, memory=False, top=30):
+        self.cpu = cProfile.Profile() if cpu else None
+        self.memory = memory
+        self.top = top
+
+    def start(self):
+        if self.memory:
+            tracemalloc.start()
+        if self.cpu is not None:
+            self.cpu.enable()
+
+    def stop(self, output_dir):
+        # returns the summary stored in metrics.json
+        summary = {}
+        if self.cpu is not None:
+            self.cpu.disable()
+            self.cpu.dump_stats(os.path.join(output_dir, 'profile.prof'))
+            stream = io.StringIO()
+            pstats.Stats(self.cpu, stream=stream).sort_stats('cumulative').print_stats(self.top)
+            with open(os.path.join(output_dir, 'profile.txt'), 'w') as f:
+                f.write(stream.getvalue())
+            summary['cpu_profile'] = 'profile.prof'
+        if self.memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary['memory'] = {'current_mb': current / 2 ** 20, 'peak_mb': peak / 2 ** 20,
+                                 'top': [{'location': str(stat.traceback), 'size_mb': stat.size / 2 ** 20,
+                                          'count': stat.count}
+                                         for stat in snapshot.statistics('lineno')[:self.top]]}
+        return summary
+
+
+def write_metrics(path, **extra):
+    with open(path, 'w') as f:
+        json.dump({**extra, **metrics.to_dict()}, f, indent=2, default=str)
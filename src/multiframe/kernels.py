@@ -0,0 +1,170 @@
+import logging
+import importlib.util
+import numpy as np
+from src.multiframe import physical, smoothness
+from src.multiframe.smoothness import second_derivative_anomaly
+from src.multiframe.physical import physical_anomaly_batch
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+# numba is optional and imported on the first fused_anomaly_batch call
+HAS_NUMBA = importlib.util.find_spec('numba') is not None
+# compute_anomalies uses the fused kernel when set, the numpy batch detectors otherwise
+USE_NUMBA = HAS_NUMBA
+# _fused_kernel compiled by numba, or itself without numba
+_compiled_kernel = None
+
+
+def _kernel():
+    global _compiled_kernel
+    if _compiled_kernel is None:
+        if HAS_NUMBA:
+            import numba
+            _compiled_kernel = numba.njit(cache=True, nogil=True)(_fused_kernel)
+        else:
+            _compiled_kernel = _fused_kernel
+    return _compiled_kernel
+
+
+def _fused_kernel(derivatives, age, world_height, abs_vel_z, labels, starts, lengths, tolerance, max_world_height,
+                  min_tracklet_length, max_velocity_jump, convergence_age, min_derivative_age,
+                  derivative_hits, derivative_borderline, height_hits, height_borderline, velocity_hits):
+    # one pass over the rows of every tracklet for all detectors, hits are marked on the local row the
+    # detector reports. Thresholds computed from sums in another order than np.mean are only trusted
+    # outside a tolerance, tracklets with a value inside it are flagged borderline and re-checked with numpy.
+    # Every threshold is an argument, numba would freeze module globals into its on disk cache
+    for t in range(len(starts)):
+        s = starts[t]
+        n = lengths[t]
+        last_age = age[s + n - 1]
+
+        # second derivatives, tracklets old enough for the Kalman filter to converge
+        if last_age >= min_derivative_age and n >= 3:
+            m = n - 2
+            for j in range(derivatives.shape[0]):
+                x = derivatives[j]
+                total = 0.0
+                scale = 0.0
+                for k in range(m):
+                    d = (x[s+k+2] - x[s+k+1]) - (x[s+k+1] - x[s+k])
+                    total += d
+                    scale = max(scale, abs(d))
+                avg = total / m
+                squares = 0.0
+                for k in range(m):
+                    d = (x[s+k+2] - x[s+k+1]) - (x[s+k+1] - x[s+k])
+                    squares += (d - avg) * (d - avg)
+                std = np.sqrt(squares / m)
+                upper = avg + 3*std
+                lower = avg - 3*std
+                for k in range(m):
+                    a = age[s+k+2]
+                    if a < min_derivative_age or a >= last_age or a - age[s+k] != 2:
+                        continue
+                    d = (x[s+k+2] - x[s+k+1]) - (x[s+k+1] - x[s+k])
+                    if abs(d - upper) <= tolerance * scale or abs(d - lower) <= tolerance * scale:
+                        derivative_borderline[j, t] = True
+                    if d > upper or d < lower:
+                        derivative_hits[j, s+k] = True
+
+        if n < min_tracklet_length:
+            continue
+        skip = int(n * 0.1)
+        if labels[t] == 0:
+            # world height above min(mean + 2 std, MAX_WORLD_HEIGHT) after the first 10% of the rows
+            total = 0.0
+            for i in range(skip, n):
+                total += world_height[s+i]
+            avg = total / (n - skip)
+            squares = 0.0
+            for i in range(skip, n):
+                squares += (world_height[s+i] - avg) * (world_height[s+i] - avg)
+            x = 2*np.sqrt(squares / (n - skip)) + avg
+            threshold = min(x, max_world_height)
+            for i in range(skip, n):
+                value = world_height[s+i]
+                if abs(value - x) <= tolerance * abs(value):
+                    height_borderline[t] = True
+                if value > threshold:
+                    height_hits[s+i] = True
+        elif labels[t] == 2:
+            # sign change with a jump of the longitudinal velocity, from the first row closest to convergence
+            closest = 0
+            for i in range(n):
+                if abs(age[s+i] - convergence_age) < abs(age[s+closest] - convergence_age):
+                    closest = i
+            for i in range(max(skip, closest), n - 1):
+                curr_vel = abs_vel_z[s+i]
+                next_vel = abs_vel_z[s+i+1]
+                sign_difference = (curr_vel < 0 and next_vel >= 0) or (curr_vel >= 0 and next_vel < 0)
+                if sign_difference and abs(next_vel - curr_vel) > max_velocity_jump:
+                    velocity_hits[s+i+1] = True
+
+
+def _local_hits(hits, starts):
+    # local indices of the hit rows grouped by tracklet, hits are only marked inside the (disjoint) tracklets
+    order = np.argsort(starts, kind='stable')
+    rows = np.flatnonzero(hits)
+    owner = order[np.searchsorted(starts[order], rows, side='right') - 1]
+    by_owner = np.argsort(owner, kind='stable')
+    counts = np.bincount(owner, minlength=len(starts))
+    local = (rows - starts[owner])[by_owner]
+    return np.split(local, np.cumsum(counts)[:-1])
+
+
+def fused_anomaly_batch(tracklets, derivative_columns):
+    # physical_anomaly_batch and second_derivative_anomaly_batch of tracklets of a single store in one pass.
+    # Returns the physical (flags, indices) and {key: (flags, indices)} of the second derivatives of
+    # derivative_columns (key -> store column), tracklets younger than 10 are not tested
+    if not tracklets:
+        return (np.zeros(0, dtype=bool), []), {key: (np.zeros(0, dtype=bool), []) for key in derivative_columns}
+    store = tracklets[0]._store
+    starts = np.array([tracklet.offset for tracklet in tracklets], dtype=np.int64)
+    lengths = np.array([len(tracklet) for tracklet in tracklets], dtype=np.int64)
+    labels = np.asarray(store.column('label'))[starts].astype(np.int64)
+    derivatives = np.stack([np.asarray(store.column(column)) for column in derivative_columns.values()])
+    age = np.asarray(store.column('age')).astype(np.int64)
+    world_height = np.asarray(store.column('world_height'))
+    abs_vel_z = np.asarray(store.column('abs_vel_z'))
+    # sums are accumulated in float64, float32 columns get a tolerance of their own precision
+    tolerance = max(1e-9, 1e3 * np.finfo(derivatives.dtype).eps) if derivatives.dtype.kind == 'f' else 1e-9
+
+    num_rows = len(age)
+    derivative_hits = np.zeros((len(derivative_columns), num_rows), dtype=bool)
+    derivative_borderline = np.zeros((len(derivative_columns), len(starts)), dtype=bool)
+    height_hits = np.zeros(num_rows, dtype=bool)
+    height_borderline = np.zeros(len(starts), dtype=bool)
+    velocity_hits = np.zeros(num_rows, dtype=bool)
+    # numpy compares the column with MAX_WORLD_HEIGHT in the precision of the column
+    max_world_height = float(world_height.dtype.type(physical.MAX_WORLD_HEIGHT))
+    _kernel()(derivatives, age, world_height, abs_vel_z, labels, starts, lengths, tolerance, max_world_height,
+              int(physical.MIN_TRACKLET_LENGTH), float(physical.MAX_VELOCITY_JUMP), int(physical.CONVERGENCE_AGE),
+              int(smoothness.MIN_DERIVATIVE_AGE),
+              derivative_hits, derivative_borderline, height_hits, height_borderline, velocity_hits)
+
+    derivative_results = {}
+    for j, (key, column) in enumerate(derivative_columns.items()):
+        indices = _local_hits(derivative_hits[j], starts)
+        for t in np.flatnonzero(derivative_borderline[j]):
+            rows = slice(starts[t], starts[t] + lengths[t])
+            indices[t] = np.array(second_derivative_anomaly(store.column(column)[rows], store.column('age')[rows])[1],
+                                  dtype=np.int64)
+        derivative_results[key] = (np.array([len(i) > 0 for i in indices], dtype=bool), indices)
+
+    indices = _local_hits(height_hits | velocity_hits, starts)
+    borderline = np.flatnonzero(height_borderline)
+    if len(borderline):
+        _, borderline_indices = physical_anomaly_batch([tracklets[t] for t in borderline])
+        for t, tracklet_indices in zip(borderline, borderline_indices):
+            indices[t] = tracklet_indices
+    flags = np.array([len(i) > 0 for i in indices], dtype=bool)
+
+    frames, uids = store.column('name'), store.column('uid')
+    for t in np.flatnonzero(flags & ~np.isin(np.arange(len(starts)), borderline)):
+        if labels[t] == 0:
+            logger.info(f'Height anomaly for label:{labels[t]} ; uid:{uids[starts[t]]}')
+        else:
+            for i in indices[t]:
+                logger.info(f'Longitudinal velocity anomaly at frame: {frames[starts[t]+i]} for label:{labels[t]} ; '
+                            f'uid:{uids[starts[t]]}')
+    return (flags, indices), derivative_results
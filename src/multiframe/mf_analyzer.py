@@ -1,23 +1,97 @@
 import os
 import tqdm
+import concurrent.futures
 import numpy as np
 import pandas as pd
 from src.multiframe.mf_parser import MFParser
+from src.multiframe.mf_stream import MFStreamParser, IDLE_FRAMES
+from src.multiframe.mf_cache import MFCache
+from src.multiframe.mf_index import TrackletIndex, FrameIndex
+from src.multiframe.tracklet import compute_anomalies
+from src.multiframe.rendering import Renderer
+from src.multiframe.mf_output import TableWriter
+from src.multiframe.mf_pipeline import produce, WriterPool
+from src.multiframe.mf_stats import FleetStats, fleet_source
+from src.multiframe.mf_results import ResultCache
 from src.utils import setup_logger
+from src.instrumentation import metrics, Profiler, write_metrics
 
 MF_LABELS = [0, 1, 2]
+STAGES = ['physical_anomalies', 'derivatives_anomalies', 'cipv_analysis']
 
 
 class MFAnalyzer:
     def __init__(self, path, **kwargs):
-        self.df = pd.read_csv(path, sep='\t')
-        # TODO: add truncation column to OD cametra dataframe
-        self.tracklets = MFParser(self.df).apply()
-        if 'output_dir' in kwargs.keys():
+        self.path = path
+        metrics.reset()
+        self.profiler = Profiler(cpu=kwargs.get('profile', False), memory=kwargs.get('trace_memory', False))
+        self.profiler.start()
+        # fleet statistics of this log, merged into the fleet_stats file by the caller
+        self.stats = FleetStats() if kwargs.get('update_fleet_stats', False) else None
+        self.source = fleet_source(path) if self.stats is not None else None
+        if kwargs.get('stream', False):
+            # tracklets are parsed chunk by chunk in analyze_stream
+            self.store = None
+            self.tracklets = []
+        else:
+            self.store = self._load_store(path, **kwargs)
+            self.tracklets = self.store.tracklets()
+            self._add_stats(self.store)
+        with metrics.timer('load.index'):
+            self.index = TrackletIndex(self.tracklets)
+        # built on the first frame query
+        self._frame_index = None
+        if kwargs.get('output_dir') is not None:
             self.output_dir(kwargs['output_dir'])
         else:
             self.output_dir(os.path.dirname(path))
         self.set_logger()
+        # population thresholds of the fleet_stats file, used by the detectors instead of the fixed ones
+        self.fleet = None
+        if kwargs.get('fleet_thresholds', False):
+            self.fleet = FleetStats.load(kwargs['fleet_stats'])
+            if not self.fleet.sources:
+                self.logger.warning(f'No fleet statistics in {kwargs["fleet_stats"]}, using the fixed thresholds')
+        # detector results and plots of unchanged tracklets are reused from the result_cache directory
+        render_options = {'fast': kwargs.get('fast_plots', False), 'dpi': kwargs.get('plot_dpi'),
+                          'scale': kwargs.get('plot_scale', 1.0)}
+        self.results = None
+        if kwargs.get('result_cache') is not None:
+            self.results = ResultCache(kwargs['result_cache'], int(kwargs.get('result_cache_size', 2048) * 2**20),
+                                       self.fleet, render_options)
+        # 'directories' writes a tsv per flagged tracklet and stage, 'table' writes the flagged tracklets once to
+        # consolidated tables and keeps the directories for the plots only, 'both' does both
+        output_format = kwargs.get('output_format', 'directories')
+        self.write_directories = output_format != 'table'
+        self.table = None
+        if output_format != 'directories':
+            self.table = TableWriter(self.output_dir, kwargs.get('table_format'))
+        self.renderer = Renderer(kwargs.get('workers', 1), enabled=not kwargs.get('no_plots', False),
+                                 cache=self.results, **render_options)
+        # thread pool of the tsv and plot writes in pipeline mode, writes are done in place otherwise
+        self.writer = None
+        # stage -> label -> number of saved tracklets
+        self.anomaly_counts = {stage: {label: 0 for label in MF_LABELS} for stage in STAGES}
+
+    @staticmethod
+    def _load_store(path, cache=True, rebuild_cache=False, cache_dir=None, **kwargs):
+        # the parsed file is cached only when a cache_dir is given
+        mf_cache = MFCache(path, cache_dir) if cache and cache_dir is not None else None
+        if mf_cache is not None and not rebuild_cache:
+            with metrics.timer('load.cache_read'):
+                store = mf_cache.load()
+            if store is not None:
+                return store
+        with metrics.timer('load.read_csv'):
+            df = pd.read_csv(path, sep='\t')
+        metrics.count('rows_read', len(df))
+        # TODO: add truncation column to OD cametra dataframe
+        with metrics.timer('load.segmentation'):
+            store = MFParser(df).store()
+        if mf_cache is not None:
+            with metrics.timer('load.cache_write'):
+                mf_cache.save(store)
+        return store
 
     def __len__(self):
         return len(self.tracklets)
@@ -25,103 +99,249 @@ class MFAnalyzer:
     def set_logger(self):
         path = os.path.join(self.output_dir, 'log.log')
         self.logger = setup_logger(path, name='mf_analyser')
+        self.log_handler = self.logger.handlers[-1]
 
     def output_dir(self, path):
         self.output_dir = os.path.join(path, 'output')
         os.makedirs(self.output_dir, exist_ok=True)
 
     def get_labels(self):
-        return np.unique(self.df['label'].to_numpy())
+        if self.store is None:
+            # the tracklets of a stream are released once reported
+            raise ValueError('the labels of a streamed file are not kept, create the analyzer without stream')
+        return np.unique(self.store.column('label'))
 
     def longest_tracklet_by_label(self, label):
-        tracklets = self.get_tracklets_by_label(label)
-        age = 0
-        for tracklet in tracklets:
-            if tracklet.age > age:
-                age = tracklet.age
-                longest_tracklet = tracklet
-        return longest_tracklet
+        return self.index.longest(label)
 
     def shortes_tracklet_by_label(self, label):
-        tracklets = self.get_tracklets_by_label(label)
-        age = 10e6
-        for tracklet in tracklets:
-            if tracklet.age < age:
-                age = tracklet.age
-                shortest_tracklet = tracklet
-        return shortest_tracklet
+        return self.index.shortest(label)
+
+    def top_tracklets_by_label(self, label, k):
+        # k oldest tracklets of the label
+        return self.index.top(label, k)
 
     def get_tracklets_by_label(self, label):
-        tracklets = []
-        for tracklet in self.tracklets:
-            if tracklet.label == label:
-                tracklets.append(tracklet)
-        return tracklets
+        return self.index.by_label.get(label, [])
+
+    def get_tracklets_by_uid(self, uid):
+        return self.index.by_uid.get(uid, [])
 
+    @property
+    def frame_index(self):
+        if self._frame_index is None:
+            with metrics.timer('load.frame_index'):
+                self._frame_index = FrameIndex(self.tracklets)
+        return self._frame_index
+
+    def tracklets_at(self, frame):
+        # tracklets alive at frame (a value of the name column)
+        return self.frame_index.tracklets_at(frame)
+
+    def tracklets_in(self, frame_range):
+        # tracklets overlapping the (first, last) frames, both included
+        first, last = frame_range
+        return self.frame_index.tracklets_in(first, last)
+
+    @metrics.timed('stage.save_tracklets')
     def save_tracklets(self):
         self.logger.info('Saving tracklets')
         tracklets_dir = os.path.join(self.output_dir, 'tracklets')
-        os.makedirs(tracklets_dir, exist_ok=True)
+        self._makedirs(tracklets_dir)
         for label in MF_LABELS:
             label_dir = os.path.join(tracklets_dir, str(label))
-            os.makedirs(label_dir, exist_ok=True)
+            self._makedirs(label_dir)
             tracklets = self.get_tracklets_by_label(label)
             for i, tracklet in enumerate(tracklets):
                 tracklet_dir = os.path.join(label_dir, str(i))
-                os.makedirs(tracklet_dir, exist_ok=True)
-                tracklet_path = os.path.join(tracklet_dir, f'tracklet_uid_{tracklet.uid}.tsv')
-                tracklet.save_dataframe(tracklet_path)
-                tracklet.save_graphs(tracklet_dir)
+                self._save_tracklet(tracklet, tracklet_dir, jobs=tracklet.graphs_jobs(tracklet_dir))
+        self.renderer.wait()
+
+    @metrics.timed('stage.compute_anomalies')
+    def compute_all_anomalies(self):
+        # detectors run once for all tracklets, report stages read the cached results
+        pending = [tracklet for tracklet in self.tracklets
+                   if 'physical' not in tracklet.anomalies or 'derivatives' not in tracklet.anomalies]
+        if pending:
+            self.logger.info('Computing anomalies')
+            compute_anomalies(pending, self.fleet, self.results)
+            metrics.count('tracklets_processed', len(pending))
 
+    @metrics.timed('stage.physical_anomalies')
     def save_tracklets_with_physical_anomalies(self):
         self.logger.info('Anomaly detection according to unphysical changes')
+        self.compute_all_anomalies()
         tracklets_dir = os.path.join(self.output_dir, 'physical_anomalies')
-        os.makedirs(tracklets_dir, exist_ok=True)
+        self._makedirs(tracklets_dir)
         for label in MF_LABELS:
             label_dir = os.path.join(tracklets_dir, str(label))
-            os.makedirs(label_dir, exist_ok=True)
+            self._makedirs(label_dir)
             tracklets = self.get_tracklets_by_label(label)
             for i, tracklet in tqdm.tqdm(enumerate(tracklets)):
                 if tracklet.physical_anomaly():
-                    tracklet_dir = os.path.join(label_dir, str(i))
-                    os.makedirs(tracklet_dir, exist_ok=True)
-                    tracklet_path = os.path.join(tracklet_dir, f'tracklet_uid_{tracklet.uid}.tsv')
-                    tracklet.save_dataframe(tracklet_path)
-                    tracklet.save_graphs(tracklet_dir)
+                    self._save_physical_anomaly(tracklet, i)
+        self.renderer.wait()
     
+    @metrics.timed('stage.derivatives_anomalies')
     def save_tracklets_with_derivatives_anomalies(self):
         self.logger.info('Anomaly detection using derivatives')
+        self.compute_all_anomalies()
         tracklets_dir = os.path.join(self.output_dir, 'derivatives_anomalies')
-        os.makedirs(tracklets_dir, exist_ok=True)
+        self._makedirs(tracklets_dir)
         for label in MF_LABELS:
             label_dir = os.path.join(tracklets_dir, str(label))
-            os.makedirs(label_dir, exist_ok=True)
+            self._makedirs(label_dir)
             tracklets = self.get_tracklets_by_label(label)
             for i, tracklet in tqdm.tqdm(enumerate(tracklets)):
                 if tracklet.derivatives_anomaly():
-                    tracklet_dir = os.path.join(label_dir, str(i))
-                    os.makedirs(tracklet_dir, exist_ok=True)
-                    tracklet_path = os.path.join(tracklet_dir, f'tracklet_uid_{tracklet.uid}.tsv')
-                    tracklet.save_dataframe(tracklet_path)
-                    tracklet.save_derivatives(tracklet_dir)
+                    self._save_derivatives_anomaly(tracklet, i)
+        self.renderer.wait()
     
+    @metrics.timed('stage.cipv_analysis')
     def analyze_cipv(self):
         self.logger.info('Anomaly detection on CIPV objects')
-        tracklets_dir = os.path.join(self.output_dir, 'cipv_analysis')
+        self.compute_all_anomalies()
         tracklets = self.get_cipv_tracklets()
         for i, tracklet in tqdm.tqdm(enumerate(tracklets)):
             if tracklet.derivatives_anomaly() or tracklet.physical_anomaly():
-                tracklet_dir = os.path.join(tracklets_dir, str(i))
-                os.makedirs(tracklet_dir, exist_ok=True)
-                tracklet_path = os.path.join(tracklet_dir, f'tracklet_uid_{tracklet.uid}.tsv')
-                tracklet.save_dataframe(tracklet_path)
-                tracklet.save_derivatives(tracklet_dir)
-                tracklet._plot_kinematics(tracklet_dir)
+                self._save_cipv_anomaly(tracklet, i)
+        self.renderer.wait()
+
+    @metrics.timed('stage.stream')
+    def analyze_stream(self, chunksize=100000, idle_frames=IDLE_FRAMES):
+        # tracklets are detected and saved as soon as their segment is closed, only active tracks are kept
+        # in memory. Tracklets are numbered in the order they are closed
+        self.logger.info('Streaming anomaly detection')
+        self._make_report_dirs()
+        counts = self._report_counts()
+        for tracklets in self._tracklet_batches(chunksize=chunksize, idle_frames=idle_frames):
+            self._report(tracklets, counts)
+        self.renderer.wait()
+
+    @metrics.timed('stage.pipeline')
+    def analyze_pipeline(self, batch_size=256, queue_size=8, writers=4, chunksize=100000, idle_frames=IDLE_FRAMES):
+        # producer thread -> detection on the calling thread -> writer threads, connected by bounded queues.
+        # Gives the output tree of the three report stages, or of analyze_stream in stream mode. Without stream the
+        # full width store is parsed up front and sliced in parse order, the tracklets keep the sequential numbering
+        # and parsing overlaps detection only in stream mode
+        self.logger.info('Pipelined anomaly detection')
+        self._make_report_dirs()
+        counts = self._report_counts()
+        self.renderer.start()
+        self.writer = WriterPool(writers)
+        try:
+            for tracklets in produce(self._tracklet_batches(batch_size, chunksize, idle_frames), queue_size):
+                self._report(tracklets, counts)
+        finally:
+            writer, self.writer = self.writer, None
+            writer.close()
+        self.renderer.wait()
+
+    def _tracklet_batches(self, batch_size=256, chunksize=100000, idle_frames=IDLE_FRAMES):
+        # tracklets in parse order, or in the order their segment is closed in stream mode
+        if self.store is None:
+            for store in MFStreamParser(self.path, chunksize, idle_frames).stores():
+                metrics.count('rows_read', store.num_rows)
+                self._add_stats(store)
+                yield store.tracklets()
+        else:
+            for start in range(0, len(self.tracklets), batch_size):
+                yield self.tracklets[start:start + batch_size]
+
+    def _add_stats(self, store):
+        if self.stats is not None:
+            with metrics.timer('stage.fleet_stats'):
+                # the stores of a stream are parts of the same log
+                self.stats.add_store(store)
+                self.stats.sources.add(self.source)
+
+    def _make_report_dirs(self):
+        for stage in ['physical_anomalies', 'derivatives_anomalies']:
+            for label in MF_LABELS:
+                self._makedirs(os.path.join(self.output_dir, stage, str(label)))
+
+    @staticmethod
+    def _report_counts():
+        # running tracklet number per label and of the cipv tracklets, the directory names of the reports
+        return {'cipv': 0, **{label: 0 for label in MF_LABELS}}
+
+    def _report(self, tracklets, counts):
+        # all reports of a batch of tracklets, numbered like the report stages number them
+        with metrics.timer('stage.compute_anomalies'):
+            compute_anomalies(tracklets, self.fleet, self.results)
+        metrics.count('tracklets_processed', len(tracklets))
+        for tracklet in tracklets:
+            i = counts[tracklet.label]
+            counts[tracklet.label] += 1
+            if tracklet.physical_anomaly():
+                self._save_physical_anomaly(tracklet, i)
+            if tracklet.derivatives_anomaly():
+                self._save_derivatives_anomaly(tracklet, i)
+            if self._is_cipv(tracklet):
+                if tracklet.derivatives_anomaly() or tracklet.physical_anomaly():
+                    self._save_cipv_anomaly(tracklet, counts['cipv'])
+                counts['cipv'] += 1
+
+    def _makedirs(self, path):
+        # the per tracklet directories only exist when a tsv or a plot is written into them
+        if self.write_directories or self.renderer.enabled:
+            os.makedirs(path, exist_ok=True)
+
+    def _save_tracklet(self, tracklet, tracklet_dir, stage=None, jobs=()):
+        self._makedirs(tracklet_dir)
+        if self.table is not None and stage is not None:
+            plot_dir = os.path.relpath(tracklet_dir, self.output_dir) if self.renderer.enabled else None
+            self.table.add(tracklet, stage, plot_dir)
+        if self.writer is not None:
+            self.writer.submit(self._write, tracklet, tracklet_dir, jobs, True)
+        else:
+            self._write(tracklet, tracklet_dir, jobs)
+
+    def _write(self, tracklet, tracklet_dir, jobs, block=False):
+        if self.write_directories:
+            tracklet_path = os.path.join(tracklet_dir, f'tracklet_uid_{tracklet.uid}.tsv')
+            tracklet.save_dataframe(tracklet_path)
+        futures = self.renderer.submit(jobs)
+        if block:
+            # a writer thread holds its slot until its plots are rendered, bounding the plots in flight
+            concurrent.futures.wait(futures)
+
+    def _save_physical_anomaly(self, tracklet, i):
+        tracklet_dir = os.path.join(self.output_dir, 'physical_anomalies', str(tracklet.label), str(i))
+        self._save_tracklet(tracklet, tracklet_dir, 'physical_anomalies', tracklet.graphs_jobs(tracklet_dir))
+        self.anomaly_counts['physical_anomalies'][tracklet.label] += 1
+        metrics.count('anomalies.physical_anomalies')
+
+    def _save_derivatives_anomaly(self, tracklet, i):
+        tracklet_dir = os.path.join(self.output_dir, 'derivatives_anomalies', str(tracklet.label), str(i))
+        self._save_tracklet(tracklet, tracklet_dir, 'derivatives_anomalies', tracklet.derivatives_jobs(tracklet_dir))
+        self.anomaly_counts['derivatives_anomalies'][tracklet.label] += 1
+        metrics.count('anomalies.derivatives_anomalies')
+
+    def _save_cipv_anomaly(self, tracklet, i):
+        tracklet_dir = os.path.join(self.output_dir, 'cipv_analysis', str(i))
+        self._save_tracklet(tracklet, tracklet_dir, 'cipv_analysis',
+                            tracklet.derivatives_jobs(tracklet_dir) + [tracklet._kinematics_job(tracklet_dir)])
+        self.anomaly_counts['cipv_analysis'][tracklet.label] += 1
+        metrics.count('anomalies.cipv_analysis')
+
+    def close(self):
+        self.renderer.close()
+        if self.table is not None:
+            self.table.close()
+        if self.results is not None:
+            self.results.close()
+        profile = self.profiler.stop(self.output_dir)
+        write_metrics(os.path.join(self.output_dir, 'metrics.json'), file=self.path, anomaly_counts=self.anomaly_counts,
+                      **profile)
+        # the logger is shared by every analyzer of the process, stop writing to this run's log
+        self.logger.removeHandler(self.log_handler)
+        self.log_handler.close()
     
     def get_cipv_tracklets(self):
-        tracklets = []
-        for tracklet in self.tracklets:
-            if tracklet.label == 2 and 1 in tracklet.is_cipv:
-                tracklets.append(tracklet)
-        return tracklets
+        return self.index.cipv_tracklets
+
+    @staticmethod
+    def _is_cipv(tracklet):
+        return tracklet.label == 2 and 1 in tracklet.is_cipv
 
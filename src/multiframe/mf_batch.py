@@ -0,0 +1,107 @@
+import os
+import glob
+import json
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from src.multiframe.mf_analyzer import MFAnalyzer, STAGES, MF_LABELS
+from src.multiframe.mf_stream import IDLE_FRAMES
+from src.multiframe.mf_stats import FleetStats, update_fleet_stats
+from src.utils import setup_logger
+
+
+def find_cametra_files(pattern):
+    # a directory is searched recursively for .tsv files, anything else is a glob pattern
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '**', '*.tsv')
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+def output_dirs(paths, output_root):
+    # one output directory per file, named after its path relative to the common parent of all files
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    return {path: os.path.join(output_root, os.path.splitext(os.path.relpath(os.path.abspath(path), root))[0])
+            for path in paths}
+
+
+def analyze_file(path, output_dir=None, **kwargs):
+    mfa = _run(path, output_dir, **kwargs)
+    if mfa.stats is not None:
+        update_fleet_stats(kwargs['fleet_stats'], [mfa.stats])
+    return mfa.anomaly_counts
+
+
+def _run(path, output_dir=None, **kwargs):
+    mfa = MFAnalyzer(path, output_dir=output_dir, **kwargs)
+    idle_frames = IDLE_FRAMES if kwargs.get('idle_frames') is None else kwargs['idle_frames']
+    try:
+        if kwargs.get('pipeline', False):
+            mfa.analyze_pipeline(kwargs.get('batch_size', 256), kwargs.get('queue_size', 8), kwargs.get('writers', 4),
+                                 kwargs.get('chunksize', 100000), idle_frames)
+        elif kwargs.get('stream', False):
+            mfa.analyze_stream(kwargs.get('chunksize', 100000), idle_frames)
+        else:
+            mfa.compute_all_anomalies()
+            mfa.save_tracklets_with_physical_anomalies()
+            mfa.save_tracklets_with_derivatives_anomalies()
+            mfa.analyze_cipv()
+    finally:
+        mfa.close()
+    return mfa
+
+
+def _analyze_file(path, output_dir, kwargs):
+    try:
+        mfa = _run(path, output_dir, **kwargs)
+        result = {'file': path, 'output_dir': output_dir, 'status': 'ok', 'anomaly_counts': mfa.anomaly_counts}
+        if mfa.stats is not None:
+            # merged by the parent, the stats file is written once per batch
+            result['fleet_stats'] = mfa.stats.to_dict()
+        return result
+    except Exception:
+        return {'file': path, 'output_dir': output_dir, 'status': 'failed', 'error': traceback.format_exc()}
+
+
+def run_batch(pattern, output_root, jobs=1, **kwargs):
+    # runs the full analysis of every file on a pool of jobs processes, a failing file does not stop the batch
+    paths = find_cametra_files(pattern)
+    os.makedirs(output_root, exist_ok=True)
+    logger = setup_logger(os.path.join(output_root, 'batch.log'), name='mf_batch')
+    logger.info(f'Analyzing {len(paths)} files from {pattern}')
+    results = []
+    if paths:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {path: executor.submit(_analyze_file, path, output_dir, kwargs)
+                       for path, output_dir in output_dirs(paths, output_root).items()}
+            for path, future in futures.items():
+                try:
+                    results.append(future.result())
+                except Exception:
+                    # the worker process itself died
+                    results.append({'file': path, 'status': 'failed', 'error': traceback.format_exc()})
+    for result in results:
+        if result['status'] == 'failed':
+            logger.error(f'Failed to analyze {result["file"]}:\n{result["error"]}')
+    stats = [FleetStats.from_dict(result.pop('fleet_stats')) for result in results if 'fleet_stats' in result]
+    if stats:
+        update_fleet_stats(kwargs['fleet_stats'], stats)
+        logger.info(f'Updated fleet statistics {kwargs["fleet_stats"]} with {len(stats)} files')
+    write_summary(results, output_root)
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+    return results
+
+
+def write_summary(results, output_root):
+    with open(os.path.join(output_root, 'summary.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+    rows = []
+    for result in results:
+        row = {'file': result['file'], 'status': result['status']}
+        counts = result.get('anomaly_counts', {})
+        for stage in STAGES:
+            for label in MF_LABELS:
+                row[f'{stage}_{label}'] = counts.get(stage, {}).get(label)
+        rows.append(row)
+    pd.DataFrame(rows).to_csv(os.path.join(output_root, 'summary.tsv'), sep='\t', index=False)
@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from src.multiframe.tracklet import TrackletStore
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+CACHE_VERSION = 1
+# bytes hashed at the head and at the tail of the source file
+HASH_BLOCK = 1 << 20
+
+
+def source_key(path):
+    # size, mtime and a hash of the head and tail of the file, cheap even for multi GB logs
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_BLOCK))
+        if stat.st_size > HASH_BLOCK:
+            f.seek(max(HASH_BLOCK, stat.st_size - HASH_BLOCK))
+            digest.update(f.read(HASH_BLOCK))
+    return {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'hash': digest.hexdigest()}
+
+
+class MFCache:
+    # cache of a parsed cametra file: one .npy file per store column plus the tracklet offsets, loaded as
+    # memory maps instead of parsing the tsv again. Caches of all files live in root, never in the input tree
+    def __init__(self, path, root):
+        self.path = path
+        name = hashlib.blake2b(os.path.abspath(path).encode(), digest_size=8).hexdigest()
+        self.cache_dir = os.path.join(root, f'{os.path.basename(path)}.{name}.mfcache')
+        self.meta_path = os.path.join(self.cache_dir, 'meta.json')
+
+    def load(self):
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta['source'] != source_key(self.path):
+            logger.info(f'Stale cache {self.cache_dir}')
+            return None
+        logger.info(f'Loading cache {self.cache_dir}')
+        columns = {name: self._load(f'column_{i}') for i, name in enumerate(meta['columns'])}
+        return TrackletStore(columns, self._load('starts'), self._load('lengths'), self._load('rows'))
+
+    def save(self, store: TrackletStore):
+        # a cache that can not be written only costs the next run a parse, returns False then
+        logger.info(f'Writing cache {self.cache_dir}')
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # the meta file is written last, an interrupted write leaves no valid cache
+            if os.path.exists(self.meta_path):
+                os.remove(self.meta_path)
+            for i, values in enumerate(store.columns.values()):
+                self._save(f'column_{i}', values)
+            self._save('starts', store.starts)
+            self._save('lengths', store.lengths)
+            self._save('rows', store.rows)
+            meta = {'source': source_key(self.path), 'columns': list(store.columns)}
+            with open(self.meta_path, 'w') as f:
+                json.dump(meta, f)
+        except OSError as e:
+            logger.warning(f'Could not write cache {self.cache_dir}: {e}')
+            return False
+        return True
+
+    def _load(self, name):
+        return np.load(os.path.join(self.cache_dir, f'{name}.npy'), mmap_mode='r')
+
+    def _save(self, name, values):
+        values = np.asarray(values)
+        if values.dtype == object:
+            # memory maps need fixed width values, missing strings are written as empty cells anyway
+            values = np.where(pd.isna(values), '', values).astype(str)
+        np.save(os.path.join(self.cache_dir, f'{name}.npy'), values)
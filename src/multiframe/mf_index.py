@@ -0,0 +1,129 @@
+import numpy as np
+
+
+class TrackletIndex:
+    # lookups built once after parsing: label -> tracklets, uid -> tracklets, CIPV membership and
+    # per label tracklets ordered by age. Lists keep the parsing order of the tracklets
+    def __init__(self, tracklets):
+        self.by_label = {}
+        self.by_uid = {}
+        for tracklet in tracklets:
+            self.by_label.setdefault(tracklet.label, []).append(tracklet)
+            self.by_uid.setdefault(tracklet.uid, []).append(tracklet)
+        # stable sorts, ties keep the parsing order like the linear scans did
+        self.by_age = {label: sorted(label_tracklets, key=lambda tracklet: tracklet.age)
+                       for label, label_tracklets in self.by_label.items()}
+        self.by_age_descending = {label: sorted(label_tracklets, key=lambda tracklet: -tracklet.age)
+                                  for label, label_tracklets in self.by_label.items()}
+        self.cipv_tracklets = self._cipv_tracklets(tracklets)
+        self.cipv = set(self.cipv_tracklets)
+
+    @staticmethod
+    def _cipv_tracklets(tracklets):
+        cipv_tracklets = []
+        stores = {}
+        for tracklet in tracklets:
+            stores.setdefault(id(tracklet._store), tracklet._store)
+        # number of cipv rows before every row of each store
+        cumulative = {key: np.concatenate([[0], np.cumsum(store.column('is_cipv') == 1)])
+                      for key, store in stores.items()}
+        for tracklet in tracklets:
+            if tracklet.label != 2:
+                continue
+            cipv_rows = cumulative[id(tracklet._store)]
+            if cipv_rows[tracklet.offset + tracklet.length] > cipv_rows[tracklet.offset]:
+                cipv_tracklets.append(tracklet)
+        return cipv_tracklets
+
+    def longest(self, label):
+        tracklets = self.by_age_descending.get(label)
+        return tracklets[0] if tracklets else None
+
+    def shortest(self, label):
+        tracklets = self.by_age.get(label)
+        return tracklets[0] if tracklets else None
+
+    def top(self, label, k):
+        return self.by_age_descending.get(label, [])[:k]
+
+
+class FrameIndex:
+    # frame queries over the tracklets: an interval tree of the [first, last] frame span of every tracklet and a
+    # frame -> row offsets index of their store. Tree nodes are the spans sorted by first frame, node mid of
+    # the range lo:hi has the children lo:mid and mid+1:hi and holds the largest last frame below it, a query
+    # only descends into subtrees that can overlap it. Results keep the parsing order of the tracklets
+    def __init__(self, tracklets):
+        self.tracklets = tracklets
+        firsts, lasts = self._spans(tracklets)
+        self.order = np.argsort(firsts, kind='stable')
+        self.firsts, self.lasts = firsts[self.order], lasts[self.order]
+        self.max_last = np.empty_like(self.lasts)
+        self._build(0, len(self.order))
+        # rows of the (single) store sorted by frame, stream stores are not row indexed
+        stores = {id(tracklet._store): tracklet._store for tracklet in tracklets}
+        self.store = next(iter(stores.values())) if len(stores) == 1 else None
+        if self.store is not None:
+            frames = np.asarray(self.store.column('name'))
+            self.row_order = np.argsort(frames, kind='stable')
+            self.row_frames = frames[self.row_order]
+
+    @staticmethod
+    def _spans(tracklets):
+        firsts = np.zeros(len(tracklets), dtype=np.int64)
+        lasts = np.zeros(len(tracklets), dtype=np.int64)
+        groups = {}
+        for i, tracklet in enumerate(tracklets):
+            groups.setdefault(id(tracklet._store), []).append(i)
+        for selected in groups.values():
+            store = tracklets[selected[0]]._store
+            starts = np.array([tracklets[i].offset for i in selected], dtype=np.int64)
+            ends = starts + np.array([tracklets[i].length for i in selected], dtype=np.int64)
+            # min and max of every tracklet, reduceat over the [start, end) pairs of a sentinel padded column
+            frames = np.append(np.asarray(store.column('name'), dtype=np.int64), 0)
+            bounds = np.stack([starts, ends], axis=1).ravel()
+            firsts[selected] = np.minimum.reduceat(frames, bounds)[::2]
+            lasts[selected] = np.maximum.reduceat(frames, bounds)[::2]
+        return firsts, lasts
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return np.iinfo(np.int64).min
+        mid = (lo + hi) // 2
+        self.max_last[mid] = max(self.lasts[mid], self._build(lo, mid), self._build(mid + 1, hi))
+        return self.max_last[mid]
+
+    def _overlapping(self, first, last):
+        found = []
+        stack = [(0, len(self.order))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self.max_last[mid] < first:
+                continue
+            stack.append((lo, mid))
+            if self.firsts[mid] <= last:
+                if self.lasts[mid] >= first:
+                    found.append(self.order[mid])
+                stack.append((mid + 1, hi))
+        return [self.tracklets[i] for i in sorted(found)]
+
+    def tracklets_at(self, frame):
+        # tracklets whose frame span contains frame
+        return self._overlapping(frame, frame)
+
+    def tracklets_in(self, first, last):
+        # tracklets whose frame span overlaps first..last, both included
+        return self._overlapping(first, last)
+
+    def rows_at(self, frame):
+        return self.rows_in(frame, frame)
+
+    def rows_in(self, first, last):
+        # row offsets into the store of the rows of frames first..last, in row order
+        if self.store is None:
+            raise ValueError('rows are indexed for tracklets of a single store')
+        lo = np.searchsorted(self.row_frames, first, side='left')
+        hi = np.searchsorted(self.row_frames, last, side='right')
+        return np.sort(self.row_order[lo:hi])
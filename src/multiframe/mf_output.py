@@ -0,0 +1,108 @@
+import os
+import logging
+import importlib.util
+from src.instrumentation import metrics
+
+# numpy and pandas are imported on use, main.py reads OUTPUT_FORMATS before the arguments are parsed
+
+# pyarrow is optional and imported on the first parquet write
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+OUTPUT_FORMATS = ['directories', 'table', 'both']
+# buffered rows of the tracklets table before they are appended to the file
+FLUSH_ROWS = 100000
+
+
+class TableWriter:
+    # consolidated output: the rows of every flagged tracklet are written once to tracklets.<ext> with a
+    # tracklet_id column, and reasons.<ext> holds one row per anomalous frame of each stage referencing it.
+    # table_format is 'parquet' (needs pyarrow), 'tsv', or None for parquet when available
+    def __init__(self, output_dir, table_format=None):
+        if table_format is None:
+            table_format = 'parquet' if HAS_PYARROW else 'tsv'
+        if table_format == 'parquet' and not HAS_PYARROW:
+            raise ImportError('pyarrow is required for parquet tables')
+        self.table_format = table_format
+        extension = 'parquet' if table_format == 'parquet' else 'tsv'
+        self.tracklets_path = os.path.join(output_dir, f'tracklets.{extension}')
+        self.reasons_path = os.path.join(output_dir, f'reasons.{extension}')
+        # (label, uid, first frame) -> tracklet_id, a tracklet is identified by the start of its uid segment
+        self.ids = {}
+        self.buffer = []
+        self.buffered_rows = 0
+        self.reasons = []
+        self.parquet_writer = None
+        self.num_flushes = 0
+
+    def add(self, tracklet, stage, plot_dir=None):
+        key = (int(tracklet.label), int(tracklet.uid), int(tracklet.frames[0]))
+        tracklet_id = self.ids.get(key)
+        if tracklet_id is None:
+            tracklet_id = self.ids[key] = len(self.ids)
+            self._add_rows(tracklet, tracklet_id)
+        for detector, result in tracklet.anomalies.items():
+            if not result.flag or (stage, detector) in [('physical_anomalies', 'derivatives'),
+                                                        ('derivatives_anomalies', 'physical')]:
+                continue
+            for reason, indices in result.indices.items():
+                for i in indices:
+                    self.reasons.append((tracklet_id, stage, detector, reason, int(tracklet.frames[i]), int(i),
+                                         plot_dir))
+        return tracklet_id
+
+    def _add_rows(self, tracklet, tracklet_id):
+        import numpy as np
+        store = tracklet._store
+        rows = slice(tracklet.offset, tracklet.offset + tracklet.length)
+        columns = {'tracklet_id': np.full(tracklet.length, tracklet_id, dtype=np.int64)}
+        if store.rows is not None:
+            columns['row'] = np.asarray(store.rows[rows])
+        columns.update((name, np.array(values[rows])) for name, values in store.columns.items())
+        self.buffer.append(columns)
+        self.buffered_rows += tracklet.length
+        if self.buffered_rows >= FLUSH_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        import numpy as np
+        import pandas as pd
+        df = pd.DataFrame({name: np.concatenate([columns[name] for columns in self.buffer])
+                           for name in self.buffer[0]})
+        self.buffer = []
+        self.buffered_rows = 0
+        with metrics.timer(f'write.{self.table_format}'):
+            if self.table_format == 'parquet':
+                import pyarrow
+                import pyarrow.parquet as pq
+                table = pyarrow.Table.from_pandas(df, preserve_index=False)
+                if self.parquet_writer is None:
+                    self.parquet_writer = pq.ParquetWriter(self.tracklets_path, table.schema)
+                self.parquet_writer.write_table(table)
+            else:
+                df.to_csv(self.tracklets_path, sep='\t', index=False, mode='w' if self.num_flushes == 0 else 'a',
+                          header=self.num_flushes == 0)
+        self.num_flushes += 1
+
+    def close(self):
+        import numpy as np
+        import pandas as pd
+        if self.num_flushes == 0 and not self.buffer:
+            # no flagged tracklet, still write an empty table
+            self.buffer.append({'tracklet_id': np.zeros(0, dtype=np.int64)})
+        self.flush()
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        reasons = pd.DataFrame(self.reasons, columns=['tracklet_id', 'stage', 'detector', 'reason', 'frame',
+                                                      'tracklet_index', 'plot_dir'])
+        with metrics.timer(f'write.{self.table_format}'):
+            if self.table_format == 'parquet':
+                reasons.to_parquet(self.reasons_path, index=False)
+            else:
+                reasons.to_csv(self.reasons_path, sep='\t', index=False)
+        for path in [self.tracklets_path, self.reasons_path]:
+            metrics.count_file(path)
+        logger.info(f'Wrote {len(self.ids)} tracklets to {self.tracklets_path}')
@@ -2,7 +2,7 @@ import tqdm
 import logging
 import numpy as np
 from itertools import chain
-from src.multiframe.tracklet import Tracklet
+from src.multiframe.tracklet import Tracklet, TrackletStore
 
 MF_LABELS = [0, 1, 2]
 
@@ -10,12 +10,19 @@ logger: logging.Logger = logging.getLogger("mf_analyser")
 
 
 class MFParser:
-    def __init__(self, df):
+    def __init__(self, df, mode='groupby'):
         self.df = df
+        # 'groupby' segments all uids in a single pass, 'per_uid' is the original per uid masking
+        self.mode = mode
 
     def apply(self):
-        tracklets = []
         logger.info('Parsing MF dataframe')
+        if self.mode == 'per_uid':
+            return self._apply_per_uid()
+        return self._apply_groupby()
+
+    def _apply_per_uid(self):
+        tracklets = []
         for label in MF_LABELS:
             uids = np.unique(
                 self.df[self.df['label'] == label]['uid'].to_numpy())
@@ -24,6 +31,58 @@ class MFParser:
                 tracklets.append(uid_tracklets)
         return list(chain.from_iterable(tracklets))
 
+    def _apply_groupby(self):
+        return self.store().tracklets()
+
+    def store(self):
+        df = self.df[self.df['label'].isin(MF_LABELS)]
+        labels = df['label'].to_numpy()
+        uids = df['uid'].to_numpy()
+        # stable sort by (label, uid) keeps the original row order inside every uid
+        order = np.lexsort((np.arange(len(df)), uids, labels))
+        df = df.iloc[order]
+        starts, lengths = self.segment(labels[order], uids[order], df['age'].to_numpy())
+        return TrackletStore.from_dataframe(df, starts, lengths)
+
+    @staticmethod
+    def segment(labels, uids, ages):
+        # rows are sorted by (label, uid, row order), returns start row and length of every tracklet
+        # following the same rules as _get_tracklets
+        n = len(ages)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        new_group = np.ones(n, dtype=bool)
+        new_group[1:] = (labels[1:] != labels[:-1]) | (uids[1:] != uids[:-1])
+        group_starts = np.flatnonzero(new_group)
+        group_ends = np.append(group_starts[1:], n)
+        group_ids = np.cumsum(new_group) - 1
+
+        # diff[k] compares row k+1 to row k, only meaningful inside a group
+        diff = np.diff(ages)
+        same_group = ~new_group[1:]
+        negative = same_group & (diff < 0)
+        not_positive = same_group & (diff <= 0)
+        num_negative = np.bincount(group_ids[1:][negative], minlength=len(group_starts))
+        any_not_positive = np.bincount(group_ids[1:][not_positive], minlength=len(group_starts)) > 0
+
+        # condition for singel tracklet with given uid
+        single = ~any_not_positive
+        cuts = np.flatnonzero(negative)
+        # condition for two tracklets with given uid
+        two = np.flatnonzero(num_negative == 1)
+        cuts = np.sort(np.concatenate([cuts, group_ends[two] - 2]), kind='stable')
+        cut_groups = group_ids[cuts]
+        prev_same = np.zeros(len(cuts), dtype=bool)
+        prev_same[1:] = cut_groups[1:] == cut_groups[:-1]
+        cut_starts = np.where(prev_same, np.concatenate([[0], cuts[:-1] + 1]), group_starts[cut_groups])
+
+        starts = np.concatenate([group_starts[single], cut_starts])
+        ends = np.concatenate([group_ends[single], cuts + 1])
+        keep = ends > starts
+        starts, ends = starts[keep], ends[keep]
+        order = np.argsort(starts, kind='stable')
+        return starts[order], (ends - starts)[order]
+
     def _get_tracklets(self, uid: int, label: int):
         tracklets = []
         uid_df = self.df[(self.df['uid'] == uid) & (
@@ -32,7 +91,7 @@ class MFParser:
         diff = np.diff(uid_df['age'].to_numpy())
         # condition for singel tracklet with given uid
         if self.all_positive(diff):
-            return [Tracklet(uid_df)]
+            return [Tracklet.from_dataframe(uid_df)]
 
         indeces = [i for i, x in enumerate(diff) if x < 0]
         # condition for two tracklets with given uid
@@ -42,7 +101,7 @@ class MFParser:
         for i_curr in indeces:
             df_tmp = uid_df[i_prev:i_curr+1].reset_index()
             if not df_tmp.empty:
-                tracklets.append(Tracklet(df_tmp))
+                tracklets.append(Tracklet.from_dataframe(df_tmp))
             i_prev = i_curr+1
         return tracklets
 
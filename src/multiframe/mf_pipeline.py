@@ -0,0 +1,71 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# end of the producer batches
+_DONE = object()
+
+
+def produce(batches, queue_size=8):
+    # iterates batches on a producer thread and yields them through a bounded queue,
+    # the producer blocks when the consumer is queue_size batches behind
+    batches_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+        except BaseException as e:
+            put(e)
+        put(_DONE)
+
+    producer = threading.Thread(target=run, name='mf_producer', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = batches_queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # the consumer failed or stopped early, release the producer
+        stop.set()
+        producer.join()
+
+
+class WriterPool:
+    # threads writing the tsv files and rendering the plots. At most max_pending tasks wait in the pool,
+    # submit blocks beyond that so the detector stage cannot run ahead of the disk
+    def __init__(self, threads=4, max_pending=None):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='mf_writer')
+        self.slots = threading.BoundedSemaphore(max_pending or 4 * threads)
+        self.errors = []
+
+    def submit(self, function, *args):
+        self.slots.acquire()
+        future = self.executor.submit(function, *args)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self.slots.release()
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+
+    def close(self):
+        # waits for every write, re-raises the first failure
+        self.executor.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
@@ -0,0 +1,237 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import logging
+import numpy as np
+from src.multiframe import physical
+from src.multiframe.tracklet import AnomalyResult, NO_ANOMALY, DERIVATIVE_COLUMNS, log_result
+from src.multiframe.rendering import output_path
+from src.instrumentation import metrics
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+# bump when a change outside the hashed sources changes the detector results or the plots
+RESULTS_VERSION = 1
+# columns read by the detectors, the fingerprint of a tracklet
+FINGERPRINT_COLUMNS = ['label', 'sub_class', 'age', 'world_height', 'abs_vel_z'] + \
+    [column for column in DERIVATIVE_COLUMNS.values() if column != 'abs_vel_z']
+# sources of every detector and of the plots, an edit of any of them invalidates their entries.
+# The results come from the batch detectors or from the fused kernel, both driven by tracklet.py
+DETECTOR_SOURCES = {'physical': ['physical.py', 'kernels.py', 'tracklet.py'],
+                    'derivatives': ['smoothness.py', 'kernels.py', 'tracklet.py']}
+PLOT_SOURCES = ['visualisation.py', 'rendering.py']
+DETECTORS = list(DETECTOR_SOURCES)
+
+
+def _update(digest, value):
+    # stable hash of nested dicts, lists and arrays
+    if isinstance(value, np.ndarray):
+        digest.update(f'{value.dtype.str}{value.shape}'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, bytes):
+        digest.update(value)
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            _update(digest, str(key))
+            _update(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'[{len(value)}'.encode())
+        for item in value:
+            _update(digest, item)
+    else:
+        digest.update(f'{type(value).__name__}:{value!r};'.encode())
+
+
+def _digest(*values):
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        _update(digest, value)
+    return digest.hexdigest()
+
+
+def _tmp_path(path):
+    # unique per process and thread, writers of the same entry do not collide
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+def _sources(names):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    contents = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as f:
+            contents.append(f.read())
+    return _digest(contents)
+
+
+class ResultCache:
+    # content addressed cache of detector results and plots shared by every run using cache_dir.
+    # A detector result is keyed by the fingerprint of the tracklet columns, the detector parameters and
+    # sources, a plot by its arrays, the render options and the plotting sources. Unchanged plots are hard
+    # linked into the output instead of being rendered again. Entries are evicted least recently used first
+    # when the cache grows beyond max_size bytes
+    def __init__(self, cache_dir, max_size=2 << 30, fleet=None, render_options=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        params = {'physical': {name: getattr(physical, name) for name in ['MIN_TRACKLET_LENGTH', 'MAX_WORLD_HEIGHT',
+                                                                          'MAX_VELOCITY_JUMP', 'CONVERGENCE_AGE']},
+                  'derivatives': DERIVATIVE_COLUMNS}
+        # population thresholds change the results of both detectors
+        fleet_params = None if fleet is None else json.dumps(fleet.to_dict(), sort_keys=True)
+        self.detector_versions = {detector: _digest(RESULTS_VERSION, params[detector], fleet_params,
+                                                    _sources(DETECTOR_SOURCES[detector]))
+                                  for detector in DETECTORS}
+        self.plot_version = _digest(RESULTS_VERSION, render_options, _sources(PLOT_SOURCES))
+        for kind in ['results', 'plots']:
+            os.makedirs(os.path.join(cache_dir, kind), exist_ok=True)
+
+    def _path(self, kind, key, extension):
+        return os.path.join(self.cache_dir, kind, key[:2], f'{key}{extension}')
+
+    @staticmethod
+    def _touch(path):
+        # the modification time orders the entries for eviction
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def fingerprint(tracklet):
+        store = tracklet._store
+        rows = slice(tracklet.offset, tracklet.offset + tracklet.length)
+        return _digest([np.asarray(store.column(column)[rows]) for column in FINGERPRINT_COLUMNS])
+
+    def fill(self, tracklets):
+        # sets the cached detector results of the tracklets, returns (tracklet, {detector: key}) of the missing ones
+        missing = []
+        hits = 0
+        for tracklet in tracklets:
+            pending = [detector for detector in DETECTORS if detector not in tracklet.anomalies]
+            if not pending:
+                continue
+            fingerprint = self.fingerprint(tracklet)
+            keys = {}
+            for detector in pending:
+                key = _digest(fingerprint, self.detector_versions[detector])
+                result = self._load_result(key)
+                if result is None:
+                    keys[detector] = key
+                else:
+                    tracklet.anomalies[detector] = result
+                    # the same log whether the result is computed or cached
+                    log_result(tracklet, detector, result)
+                    hits += 1
+            if keys:
+                missing.append((tracklet, keys))
+        if hits:
+            logger.info(f'Reusing {hits} cached detector results')
+        metrics.count('result_cache.detector_hits', hits)
+        metrics.count('result_cache.detector_misses', sum(len(keys) for _, keys in missing))
+        return missing
+
+    def store(self, missing):
+        for tracklet, keys in missing:
+            for detector, key in keys.items():
+                if detector in tracklet.anomalies:
+                    self._save_result(key, tracklet.anomalies[detector])
+
+    def _load_result(self, key):
+        path = self._path('results', key, '.json')
+        try:
+            with open(path) as f:
+                values = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        self._touch(path)
+        if not values['flag']:
+            return NO_ANOMALY
+        return AnomalyResult(True, {name: np.array(indices, dtype=np.int64)
+                                    for name, indices in values['indices'].items()}, values['keys'])
+
+    def _save_result(self, key, result):
+        path = self._path('results', key, '.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        values = {'flag': bool(result.flag), 'keys': list(result.keys),
+                  'indices': {name: np.asarray(indices).tolist() for name, indices in result.indices.items()}}
+        # written to a temporary file first, runs sharing the cache never read a partial entry
+        tmp_path = _tmp_path(path)
+        with open(tmp_path, 'w') as f:
+            json.dump(values, f)
+        os.replace(tmp_path, path)
+
+    def _plot_path(self, job):
+        # the output path is the last argument, only its file name is part of the key
+        target = output_path(job)
+        key = _digest(job.function, list(job.args[:-1]), os.path.basename(target), self.plot_version)
+        return self._path('plots', key, os.path.splitext(target)[1]), target
+
+    def link_plot(self, job):
+        # links the cached plot of job to its output path, False when it has to be rendered
+        path, target = self._plot_path(job)
+        if not self._touch(path):
+            metrics.count('result_cache.plot_misses')
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if self._link(path, target):
+            metrics.count('result_cache.plot_hits')
+            metrics.count_file(target)
+            return True
+        return False
+
+    def add_plot(self, job):
+        path, target = self._plot_path(job)
+        if os.path.exists(target):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._link(target, path)
+
+    @staticmethod
+    def _link(source, target):
+        # hard link, or a copy when the cache is on another file system
+        tmp_path = _tmp_path(target)
+        try:
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, target)
+            return True
+        except FileNotFoundError:
+            # evicted by another run in between
+            return False
+
+    def evict(self):
+        entries = []
+        for kind in ['results', 'plots']:
+            for root, _, names in os.walk(os.path.join(self.cache_dir, kind)):
+                for name in names:
+                    if name.endswith('.tmp'):
+                        # being written
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, path))
+        size = sum(entry[1] for entry in entries)
+        evicted = 0
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            evicted += 1
+        if evicted:
+            logger.info(f'Evicted {evicted} entries from the result cache {self.cache_dir}')
+        metrics.count('result_cache.evicted', evicted)
+        return size
+
+    def close(self):
+        with metrics.timer('result_cache.evict'):
+            self.evict()
@@ -0,0 +1,217 @@
+import os
+import json
+import logging
+import numpy as np
+from src.multiframe.tracklet import DERIVATIVE_COLUMNS
+from src.multiframe.mf_cache import source_key
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+STATS_VERSION = 1
+# samples needed before a distribution is trusted, sub classes with less fall back to their label
+MIN_COUNT = 1000
+WORLD_HEIGHT_QUANTILE = 0.99
+SECOND_DERIVATIVE_QUANTILES = (0.005, 0.995)
+
+
+class QuantileSketch:
+    # log bucketed quantile sketch (DDSketch): every value falls in a bucket of relative width
+    # relative_accuracy, quantiles are exact to that relative error. Sketches of any set of files are merged by
+    # adding bucket counts, in any order
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        small = np.abs(values) < self.min_value
+        self.zero += int(small.sum())
+        for buckets, selected in [(self.positive, values[~small & (values > 0)]),
+                                  (self.negative, -values[~small & (values < 0)])]:
+            keys, counts = np.unique(np.ceil(np.log(selected) / self.log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                buckets[key] = buckets.get(key, 0) + count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('sketches of different accuracy can not be merged')
+        for buckets, other_buckets in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for key, count in other_buckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+        rank = q * (self.count - 1)
+        # buckets in increasing value: negatives by decreasing key, zero, positives by increasing key
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return max(-self._value(key), self.min)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return min(self._value(key), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'relative_accuracy': self.relative_accuracy, 'min_value': self.min_value, 'count': self.count,
+                'zero': self.zero, 'min': self.min, 'max': self.max,
+                'positive': self.positive, 'negative': self.negative}
+
+    @classmethod
+    def from_dict(cls, values):
+        sketch = cls(values['relative_accuracy'], values['min_value'])
+        sketch.count, sketch.zero = values['count'], values['zero']
+        sketch.min, sketch.max = values['min'], values['max']
+        # json keys are strings
+        sketch.positive = {int(key): count for key, count in values['positive'].items()}
+        sketch.negative = {int(key): count for key, count in values['negative'].items()}
+        return sketch
+
+
+class FleetStats:
+    # distributions of world height and of the second derivatives per (label, sub_class) over every analyzed
+    # log. sources holds the key of every log already added, a log is never counted twice when stats of
+    # nightly batches are merged
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        # (label, sub_class, variable) -> QuantileSketch
+        self.sketches = {}
+        self.sources = set()
+
+    def sketch(self, label, sub_class, variable):
+        key = (int(label), int(sub_class), variable)
+        if key not in self.sketches:
+            self.sketches[key] = QuantileSketch(self.relative_accuracy)
+        return self.sketches[key]
+
+    def add_store(self, store, source=None):
+        # every tracklet of a store in the class of its first row, source identifies the log (see fleet_source)
+        if source is not None:
+            if source in self.sources:
+                logger.info('Fleet statistics already hold this log')
+                return False
+            self.sources.add(source)
+        starts, lengths = store.starts, store.lengths
+        if len(starts) == 0:
+            return True
+        labels = np.asarray(store.column('label'))[starts]
+        sub_classes = np.asarray(store.column('sub_class'))[starts]
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        local = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rows = starts[segment] + local
+        # second derivative windows start+k .. start+k+2 of tracklets with at least 3 rows
+        windows = local < lengths[segment] - 2
+        for group in np.unique(np.stack([labels, sub_classes], axis=1), axis=0):
+            label, sub_class = group
+            in_group = (labels == label) & (sub_classes == sub_class)
+            group_rows = rows[in_group[segment]]
+            self.sketch(label, sub_class, 'world_height').add(np.asarray(store.column('world_height'))[group_rows])
+            window_rows = rows[in_group[segment] & windows]
+            for key, column in DERIVATIVE_COLUMNS.items():
+                x = np.asarray(store.column(column))
+                second_derivative = (x[window_rows+2] - x[window_rows+1]) - (x[window_rows+1] - x[window_rows])
+                self.sketch(label, sub_class, key).add(second_derivative)
+        return True
+
+    def merge(self, other):
+        if other.sources & self.sources:
+            raise ValueError('fleet statistics of the same log can not be merged twice')
+        for (label, sub_class, variable), sketch in other.sketches.items():
+            self.sketch(label, sub_class, variable).merge(sketch)
+        self.sources |= other.sources
+        return self
+
+    def _distribution(self, label, sub_class, variable):
+        # the sub class distribution when it has enough samples, else the one of the whole label
+        sketch = self.sketches.get((int(label), int(sub_class), variable))
+        if sketch is not None and sketch.count >= MIN_COUNT:
+            return sketch
+        label_sketch = QuantileSketch(self.relative_accuracy)
+        for (other_label, _, other_variable), other in self.sketches.items():
+            if other_label == label and other_variable == variable:
+                label_sketch.merge(other)
+        return label_sketch if label_sketch.count >= MIN_COUNT else None
+
+    def world_height_cap(self, label, sub_class, quantile=WORLD_HEIGHT_QUANTILE):
+        sketch = self._distribution(label, sub_class, 'world_height')
+        return None if sketch is None else sketch.quantile(quantile)
+
+    def second_derivative_bounds(self, label, sub_class, key, quantiles=SECOND_DERIVATIVE_QUANTILES):
+        sketch = self._distribution(label, sub_class, key)
+        return None if sketch is None else (sketch.quantile(quantiles[0]), sketch.quantile(quantiles[1]))
+
+    def to_dict(self):
+        return {'version': STATS_VERSION, 'relative_accuracy': self.relative_accuracy,
+                'sources': sorted(self.sources),
+                'sketches': [{'label': label, 'sub_class': sub_class, 'variable': variable, **sketch.to_dict()}
+                             for (label, sub_class, variable), sketch in sorted(self.sketches.items())]}
+
+    @classmethod
+    def from_dict(cls, values):
+        stats = cls(values['relative_accuracy'])
+        stats.sources = set(values['sources'])
+        for sketch in values['sketches']:
+            stats.sketches[(sketch['label'], sketch['sub_class'], sketch['variable'])] = QuantileSketch.from_dict(sketch)
+        return stats
+
+    def save(self, path):
+        # written to a temporary file first, an interrupted save keeps the previous statistics
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(f'{path}.tmp', path)
+
+    @classmethod
+    def load(cls, path, relative_accuracy=0.01):
+        if not os.path.exists(path):
+            return cls(relative_accuracy)
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def fleet_source(path):
+    # key of a log in the statistics, a copied or renamed log keeps its key
+    key = source_key(path)
+    return f'{key["hash"]}:{key["size"]}'
+
+
+def update_fleet_stats(path, stats_list):
+    # merges the statistics of new logs into the persisted ones, statistics of logs already in the file are skipped
+    fleet = None
+    for stats in stats_list:
+        if fleet is None:
+            fleet = FleetStats.load(path, stats.relative_accuracy)
+        if stats.sources & fleet.sources:
+            logger.info(f'Fleet statistics {path} already hold {len(stats.sources & fleet.sources)} of the logs')
+            continue
+        fleet.merge(stats)
+    if fleet is not None:
+        fleet.save(path)
+    return fleet
@@ -0,0 +1,142 @@
+import logging
+import numpy as np
+import pandas as pd
+from src.multiframe.tracklet import TrackletStore
+
+MF_LABELS = [0, 1, 2]
+# frames without its uid after which a track is closed, memory is bounded by the tracks seen in this window.
+# Far above the gaps of a tracked uid (a few frames), a uid seen again later starts a new tracklet
+IDLE_FRAMES = 50
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+# columns read by Tracklet and their compact dtypes, is_occluded is optional
+CAMETRA_DTYPES = {
+    'name': np.int64,
+    'label': np.int8,
+    'sub_class': np.int8,
+    'uid': np.int32,
+    'age': np.int32,
+    'score': np.float32,
+    'world_width': np.float32,
+    'world_height': np.float32,
+    'lat_dist': np.float32,
+    'long_dist': np.float32,
+    'abs_vel_x': np.float32,
+    'abs_vel_z': np.float32,
+    'abs_acc_x': np.float32,
+    'abs_acc_z': np.float32,
+    'rel_vel_x': np.float32,
+    'rel_vel_z': np.float32,
+    'rel_acc_x': np.float32,
+    'rel_acc_z': np.float32,
+    'orientation': np.float32,
+    'lane_association': np.int8,
+    'is_cipv': np.int8,
+    'is_occluded': np.float32,
+    'x_center': np.float32,
+    'y_center': np.float32,
+    'width': np.float32,
+    'height': np.float32,
+    'd3_separation': np.float32,
+    'sf_confirmed': np.int8,
+}
+
+
+class MFStreamParser:
+    # reads a cametra tsv in chunks and emits tracklets as soon as their uid segment is closed,
+    # a segment is closed by a negative age diff, by end of file, or after idle_frames frames without the uid.
+    # idle_frames=None keeps every segment open until its uid resets or the file ends
+    def __init__(self, path, chunksize=100000, idle_frames=IDLE_FRAMES):
+        self.path = path
+        self.chunksize = chunksize
+        self.idle_frames = idle_frames
+        # (label, uid) -> list of column dicts of the open segment
+        self.active = {}
+        # (label, uid) -> index of the last frame the uid was seen
+        self.last_seen = {}
+        self.num_frames = 0
+        self.last_frame = None
+
+    def __iter__(self):
+        for store in self.stores():
+            yield from store.tracklets()
+
+    def stores(self):
+        logger.info(f'Streaming MF file {self.path}')
+        reader = pd.read_csv(self.path, sep='\t', usecols=lambda column: column in CAMETRA_DTYPES,
+                             dtype=CAMETRA_DTYPES, chunksize=self.chunksize)
+        for chunk in reader:
+            closed = self._consume(chunk)
+            closed.extend(self._close_idle())
+            if closed:
+                yield self._store(closed)
+        closed = [self._close(key) for key in list(self.active)]
+        if closed:
+            yield self._store(closed)
+
+    def _consume(self, chunk):
+        chunk = chunk[chunk['label'].isin(MF_LABELS)]
+        columns = {name: chunk[name].to_numpy() for name in chunk.columns}
+        frame_index = self._frame_index(columns['name'])
+        labels, uids, ages = columns['label'], columns['uid'], columns['age']
+        # stable sort by (label, uid) keeps the row order inside every uid
+        order = np.lexsort((np.arange(len(labels)), uids, labels))
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = (labels[order][1:] != labels[order][:-1]) | (uids[order][1:] != uids[order][:-1])
+        group_starts = np.flatnonzero(new_group)
+        closed = []
+        for rows in np.split(order, group_starts[1:]):
+            if len(rows) == 0:
+                continue
+            key = (labels[rows[0]], uids[rows[0]])
+            # Assumption: a new tracklet start when diff in age vector is negative
+            new_segment = np.diff(ages[rows]) < 0
+            if self.idle_frames is not None:
+                # or after more than idle_frames frames without the uid, whatever the chunk boundaries
+                new_segment |= np.diff(frame_index[rows]) - 1 > self.idle_frames
+            resets = np.flatnonzero(new_segment) + 1
+            if key in self.active and (ages[rows[0]] < self.active[key][-1]['age'][-1] or
+                                       self._idle(key, frame_index[rows[0]])):
+                closed.append(self._close(key))
+            for piece in np.split(rows, resets):
+                if key in self.active and piece[0] != rows[0]:
+                    closed.append(self._close(key))
+                self.active.setdefault(key, []).append({name: values[piece] for name, values in columns.items()})
+            self.last_seen[key] = frame_index[rows[-1]]
+        return closed
+
+    def _frame_index(self, frames):
+        # running index of the frame of every row, rows of a frame are consecutive in the file
+        new_frame = np.ones(len(frames), dtype=bool)
+        new_frame[1:] = frames[1:] != frames[:-1]
+        if len(frames) and frames[0] == self.last_frame:
+            new_frame[0] = False
+        frame_index = self.num_frames - 1 + np.cumsum(new_frame)
+        if len(frames):
+            self.num_frames = frame_index[-1] + 1
+            self.last_frame = frames[-1]
+        return frame_index
+
+    def _idle(self, key, frame_index):
+        # more than idle_frames frames without the uid before frame_index
+        return self.idle_frames is not None and frame_index - self.last_seen[key] - 1 > self.idle_frames
+
+    def _close_idle(self):
+        if self.idle_frames is None:
+            return []
+        # the frame after the last one read may still hold the uid
+        idle = [key for key in self.active if self._idle(key, self.num_frames)]
+        return [self._close(key) for key in idle]
+
+    def _close(self, key):
+        pieces = self.active.pop(key)
+        self.last_seen.pop(key, None)
+        return {name: np.concatenate([piece[name] for piece in pieces]) for name in pieces[0]}
+
+    @staticmethod
+    def _store(segments):
+        lengths = np.array([len(segment['age']) for segment in segments], dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        columns = {name: np.concatenate([segment[name] for segment in segments]) for name in segments[0]}
+        return TrackletStore(columns, starts, lengths)
@@ -0,0 +1,122 @@
+import logging
+import numpy as np
+from collections import namedtuple
+from src.multiframe.physical import MIN_TRACKLET_LENGTH, MAX_WORLD_HEIGHT, MAX_VELOCITY_JUMP, CONVERGENCE_AGE
+from src.multiframe.smoothness import MIN_DERIVATIVE_AGE
+from src.multiframe.tracklet import DERIVATIVE_COLUMNS
+from src.multiframe.mf_stream import IDLE_FRAMES
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+MF_LABELS = [0, 1, 2]
+
+# anomaly found on the sample of a uid at a frame, emitted while processing that frame
+AnomalyEvent = namedtuple('AnomalyEvent', ['frame', 'label', 'uid', 'detector', 'key', 'value'])
+
+
+class _Welford:
+    # running mean and population variance, same definition as np.mean and np.std
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.n) if self.n else np.nan
+
+
+class _TrackState:
+    # state of one uid: last two samples and ages, running statistics and last longitudinal velocity
+    __slots__ = ('ages', 'samples', 'second_derivatives', 'world_height', 'last_vel', 'last_frame')
+
+    def __init__(self):
+        self.ages = []
+        self.samples = {key: [] for key in DERIVATIVE_COLUMNS}
+        self.second_derivatives = {key: _Welford() for key in DERIVATIVE_COLUMNS}
+        self.world_height = _Welford()
+        self.last_vel = None
+        self.last_frame = 0
+
+
+class OnlineDetector:
+    # incremental version of the tracklet detectors, fed one frame at a time. Statistics only use the
+    # history seen so far, so every event is emitted at the frame of its sample (no added latency).
+    # A uid starts a new track when its age decreases, and is dropped after more than idle_frames frames without
+    # rows, the tracks of MFStreamParser with the same idle_frames
+    def __init__(self, idle_frames=IDLE_FRAMES):
+        self.idle_frames = idle_frames
+        self.tracks = {}
+        self.num_frames = 0
+
+    def update(self, rows):
+        # rows: dataframe or dict of arrays with the rows of a single frame
+        events = []
+        columns = {name: np.asarray(rows[name]) for name in ['name', 'label', 'uid', 'age', 'world_height']
+                   + list(DERIVATIVE_COLUMNS.values())}
+        for i in range(len(columns['age'])):
+            label = columns['label'][i]
+            if label not in MF_LABELS:
+                continue
+            key = (label, columns['uid'][i])
+            track = self.tracks.get(key)
+            if track is None or columns['age'][i] < track.ages[-1]:
+                track = self.tracks[key] = _TrackState()
+            track.last_frame = self.num_frames
+            events.extend(self._update_track(track, {name: values[i] for name, values in columns.items()}))
+        self.num_frames += 1
+        idle = [key for key, track in self.tracks.items()
+                if self.num_frames - 1 - track.last_frame > self.idle_frames]
+        for key in idle:
+            del self.tracks[key]
+        return events
+
+    def replay(self, df):
+        # feeds the rows of a cametra dataframe frame by frame, in file order
+        frames = df['name'].to_numpy()
+        boundaries = np.flatnonzero(frames[1:] != frames[:-1]) + 1
+        for rows in np.split(np.arange(len(df)), boundaries):
+            yield from self.update(df.iloc[rows])
+
+    def _update_track(self, track, row):
+        events = []
+        frame, label, uid, age = row['name'], row['label'], row['uid'], row['age']
+        track.ages = (track.ages + [age])[-3:]
+
+        for key, column in DERIVATIVE_COLUMNS.items():
+            samples = track.samples[key] = (track.samples[key] + [row[column]])[-3:]
+            if len(samples) < 3:
+                continue
+            second_derivative = (samples[2] - samples[1]) - (samples[1] - samples[0])
+            stats = track.second_derivatives[key]
+            stats.update(second_derivative)
+            three_std_cond = abs(second_derivative - stats.mean) > 3*stats.std
+            age_cond = age >= MIN_DERIVATIVE_AGE
+            unconfirmed_cond = age - track.ages[0] == 2
+            if three_std_cond and age_cond and unconfirmed_cond:
+                events.append(AnomalyEvent(frame, label, uid, 'derivatives', key, second_derivative))
+
+        if label == 0:
+            stats = track.world_height
+            stats.update(row['world_height'])
+            if stats.n >= MIN_TRACKLET_LENGTH and row['world_height'] > min(stats.mean + 2*stats.std, MAX_WORLD_HEIGHT):
+                events.append(AnomalyEvent(frame, label, uid, 'physical', 'world_height', row['world_height']))
+
+        if label == 2:
+            curr_vel, next_vel = track.last_vel, row['abs_vel_z']
+            converged = len(track.ages) > 1 and track.ages[-2] >= CONVERGENCE_AGE
+            if converged and ((curr_vel < 0 and next_vel >= 0) or (curr_vel >= 0 and next_vel < 0)) and abs(next_vel - curr_vel) > MAX_VELOCITY_JUMP:
+                events.append(AnomalyEvent(frame, label, uid, 'physical', 'abs_vel_z', next_vel))
+            track.last_vel = next_vel
+
+        for event in events:
+            logger.info(f'Online {event.detector} anomaly at {event.key} for label:{label} ; uid:{uid} at frame:{frame}')
+        return events
@@ -0,0 +1,105 @@
+import logging
+import numpy as np
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+MIN_TRACKLET_LENGTH = 5
+MAX_WORLD_HEIGHT = 2.2
+MAX_VELOCITY_JUMP = 2
+CONVERGENCE_AGE = 10
+
+
+def physical_anomaly_batch(tracklets, max_world_height=None):
+    # same result as Tracklet.physical_anomaly for every tracklet, tracklets are views of a single store.
+    # max_world_height optionally replaces MAX_WORLD_HEIGHT with a cap per tracklet, e.g. a fleet quantile
+    flags = np.zeros(len(tracklets), dtype=bool)
+    indices = [np.zeros(0, dtype=np.int64) for _ in range(len(tracklets))]
+    if not tracklets:
+        return flags, indices
+    store = tracklets[0]._store
+    starts = np.array([tracklet.offset for tracklet in tracklets], dtype=np.int64)
+    lengths = np.array([len(tracklet) for tracklet in tracklets], dtype=np.int64)
+    labels = store.column('label')[starts]
+    caps = np.full(len(tracklets), MAX_WORLD_HEIGHT) if max_world_height is None else np.asarray(max_world_height)
+    check_functions = {
+        0: lambda selected: world_height_anomaly_batch(store, starts[selected], lengths[selected], caps[selected]),
+        2: lambda selected: longitudinal_velocity_sign_change_batch(store, starts[selected], lengths[selected])
+    }
+    for label, check_func in check_functions.items():
+        selected = np.flatnonzero((labels == label) & (lengths >= MIN_TRACKLET_LENGTH))
+        if len(selected):
+            flags[selected], label_indices = check_func(selected)
+            for i, tracklet_indices in zip(selected, label_indices):
+                indices[i] = tracklet_indices
+    return flags, indices
+
+
+def _split(segment, local, mask, num_segments):
+    # local indices of the masked rows grouped by segment
+    counts = np.bincount(segment[mask], minlength=num_segments)
+    return np.split(local[mask], np.cumsum(counts)[:-1])
+
+
+def _segments(lengths):
+    # segment id and local position of every row of tracklets stored back to back
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    local = np.arange(lengths.sum()) - offsets[segment]
+    return offsets, segment, local
+
+
+def world_height_anomaly_batch(store, starts, lengths, max_world_height=MAX_WORLD_HEIGHT):
+    world_height = store.column('world_height')
+    # statistics over the rows after the first 10% of every tracklet
+    skip = (lengths * 0.1).astype(np.int64)
+    suffix_lengths = lengths - skip
+    offsets, segment, local = _segments(suffix_lengths)
+    values = world_height[(starts + skip)[segment] + local]
+
+    # sums in float64, the per tracklet statistics of float32 stores are only as precise as the column
+    avg = np.add.reduceat(values.astype(np.float64), offsets) / suffix_lengths
+    deviation = values - avg[segment]
+    std = np.sqrt(np.add.reduceat(deviation * deviation, offsets) / suffix_lengths)
+    x = 2*std + avg
+    # numpy compares the column with the cap in the precision of the column
+    caps = np.broadcast_to(max_world_height, x.shape).astype(values.dtype).astype(np.float64)
+    threshold = np.minimum(x, caps)
+    # segmented sums are not pairwise like np.mean, re-check values within rounding of the threshold
+    tolerance = max(1e-9, 1e3 * np.finfo(values.dtype).eps) if values.dtype.kind == 'f' else 1e-9
+    borderline = np.unique(segment[np.abs(values - x[segment]) <= tolerance * np.abs(values)])
+    for i in borderline:
+        suffix = values[offsets[i]:offsets[i]+suffix_lengths[i]]
+        threshold[i] = min(2*np.std(suffix) + np.mean(suffix), caps[i])
+    anomaly = values > threshold[segment]
+    flags = np.bincount(segment[anomaly], minlength=len(starts)) > 0
+
+    labels, uids = store.column('label'), store.column('uid')
+    for start in starts[flags]:
+        logger.info(
+            f'Height anomaly for label:{labels[start]} ; uid:{uids[start]}')
+    return flags, _split(segment, local + skip[segment], anomaly, len(starts))
+
+
+def longitudinal_velocity_sign_change_batch(store, starts, lengths):
+    abs_vel_z, ages = store.column('abs_vel_z'), store.column('age')
+    offsets, segment, local = _segments(lengths)
+    rows = starts[segment] + local
+    # first row whose age is closest to the convergence age, as argmin does
+    distance = np.abs(ages[rows] - CONVERGENCE_AGE)
+    closest = distance == np.minimum.reduceat(distance, offsets)[segment]
+    first_closest = np.minimum.reduceat(np.where(closest, local, lengths.max()), offsets)
+    idx = np.maximum((lengths * 0.1).astype(np.int64), first_closest)
+
+    # pair of row i and row i+1 inside a tracklet, checked from idx on
+    pairs = (local >= idx[segment]) & (local < lengths[segment] - 1)
+    curr_vel = abs_vel_z[rows[pairs]]
+    next_vel = abs_vel_z[rows[pairs] + 1]
+    sign_difference = ((curr_vel < 0) & (next_vel >= 0)) | ((curr_vel >= 0) & (next_vel < 0))
+    anomaly = sign_difference & (np.abs(next_vel - curr_vel) > MAX_VELOCITY_JUMP)
+
+    frames, labels, uids = store.column('name'), store.column('label'), store.column('uid')
+    for row in rows[pairs][anomaly]:
+        logger.info(
+            f'Longitudinal velocity anomaly at frame: {frames[row+1]} for label:{labels[row]} ; uid:{uids[row]}')
+    flags = np.bincount(segment[pairs][anomaly], minlength=len(starts)) > 0
+    return flags, _split(segment[pairs], local[pairs] + 1, anomaly, len(starts))
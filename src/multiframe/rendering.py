@@ -0,0 +1,120 @@
+import os
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from src.instrumentation import metrics
+
+logger: logging.Logger = logging.getLogger("mf_analyser")
+
+# a plot to render: name of a visualisation function and its arguments (arrays and target path)
+PlotJob = namedtuple('PlotJob', ['function', 'args'])
+
+
+# figure templates of a worker process, see FigureTemplates
+_templates = None
+
+
+def render(jobs, templates=None):
+    from src.multiframe import visualisation
+    plotter = visualisation if templates is None else templates
+    for job in jobs:
+        # outputs may be hard links into the result cache, a plot is never written through them
+        if os.path.isfile(output_path(job)):
+            os.remove(output_path(job))
+        with metrics.timer(f'render.{job.function}'):
+            getattr(plotter, job.function)(*job.args)
+        metrics.count_file(output_path(job))
+
+
+def output_path(job):
+    # the position map is given its directory, every other plot its file path
+    if job.function == 'plot_tracklet_position':
+        return os.path.join(job.args[-1], 'position_map.png')
+    return job.args[-1]
+
+
+def _init_worker(template_options):
+    global _templates
+    if template_options is not None:
+        from src.multiframe.visualisation import FigureTemplates
+        _templates = FigureTemplates(**template_options)
+
+
+def _render_job(job):
+    # the metrics of the worker are sent back and merged by the parent process
+    metrics.reset()
+    render([job], _templates)
+    return metrics.timers, metrics.counters
+
+
+class Renderer:
+    # renders plot jobs in place, or on a pool of processes when workers > 1
+    # fast=True reuses persistent figure templates, dpi and scale shrink the rendered images.
+    # A disabled renderer drops every job and never imports matplotlib. Plots found in cache
+    # (mf_results.ResultCache) are linked instead of rendered, rendered plots are added to it
+    def __init__(self, workers=1, fast=False, dpi=None, scale=1.0, enabled=True, cache=None):
+        self.workers = workers
+        self.enabled = enabled
+        self.cache = cache
+        self.template_options = {'dpi': dpi, 'scale': scale} if fast else None
+        self.templates = None
+        self.executor = None
+        self.futures = []
+        # pyplot and the figure templates are not thread safe, in place rendering is serialized
+        self.lock = threading.Lock()
+
+    def submit(self, jobs):
+        # returns the futures of the jobs sent to the pool, none when rendered in place
+        if not self.enabled:
+            return []
+        if self.cache is not None:
+            jobs = [job for job in jobs if not self.cache.link_plot(job)]
+        with self.lock:
+            if self.workers <= 1:
+                if self.template_options is not None and self.templates is None:
+                    from src.multiframe.visualisation import FigureTemplates
+                    self.templates = FigureTemplates(**self.template_options)
+                render(jobs, self.templates)
+                if self.cache is not None:
+                    for job in jobs:
+                        self.cache.add_plot(job)
+                return []
+            self.start()
+            futures = [self.executor.submit(_render_job, job) for job in jobs]
+            if self.cache is not None:
+                for job, future in zip(jobs, futures):
+                    future.add_done_callback(lambda future, job=job: self._cache_plot(future, job))
+            self.futures.extend(futures)
+            return futures
+
+    def start(self):
+        # forks the pool from the calling thread. A child forked while another thread holds a lock (metrics,
+        # logging) inherits it held, the pipeline starts the pool before its producer and writer threads
+        if not self.enabled or self.workers <= 1 or self.executor is not None:
+            return
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.template_options,))
+        # a fork pool launches all its workers on the first job
+        self.executor.submit(os.getpid).result()
+
+    def _cache_plot(self, future, job):
+        if future.exception() is None:
+            self.cache.add_plot(job)
+
+    def wait(self):
+        futures, self.futures = self.futures, []
+        with metrics.timer('render.wait'):
+            for future in futures:
+                # re-raises a failed plot in the parent process
+                timers, counters = future.result()
+                metrics.merge(timers, counters)
+
+    def close(self):
+        self.wait()
+        if self.templates is not None:
+            self.templates.close()
+            self.templates = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
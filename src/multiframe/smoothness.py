@@ -4,11 +4,14 @@ import pandas as pd
 
 logger: logging.Logger = logging.getLogger("mf_analyser")
 
+# second derivatives are tested from this age, once the Kalman filter has converged
+MIN_DERIVATIVE_AGE = 10
+
 def second_derivative_anomaly(x, age):
     # TODO: add sign change between consecutive anomalies
     def anomaly(value, avg, std, age, index):
         three_std_cond = (value > avg+3*std) or (value < avg-3*std)
-        age_cond = age[index] >= 10 and age[index] < age[-1]
+        age_cond = age[index] >= MIN_DERIVATIVE_AGE and age[index] < age[-1]
         unconfirmed_cond = age[index]-age[index-2] == 2
         return three_std_cond and age_cond and unconfirmed_cond
     
@@ -22,3 +25,57 @@ def second_derivative_anomaly(x, age):
         return False, []
     
 
+def second_derivative_anomaly_batch(x, age, starts, lengths, bounds=None):
+    # same test as second_derivative_anomaly for many tracklets stored back to back in x and age,
+    # tracklet i spans rows starts[i]:starts[i]+lengths[i]. bounds optionally holds (lower, upper) arrays of
+    # population bounds per tracklet, a value is then also required to fall outside them (nan: no bound)
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    flags = np.zeros(len(starts), dtype=bool)
+    indices = [np.zeros(0, dtype=np.int64) for _ in range(len(starts))]
+    # tracklets shorter than 3 rows have no second derivative
+    valid = np.flatnonzero(lengths >= 3)
+    if len(valid) == 0:
+        return flags, indices
+    num_windows = lengths[valid] - 2
+    window_offsets = np.concatenate([[0], np.cumsum(num_windows)[:-1]])
+    # window k of tracklet i holds np.diff(x, n=2)[k] of that tracklet, i.e. rows start+k .. start+k+2
+    segment = np.repeat(np.arange(len(valid)), num_windows)
+    local = np.arange(num_windows.sum()) - window_offsets[segment]
+    rows = starts[valid][segment] + local
+    second_derivative = np.diff(np.diff(x))[rows]
+
+    avg = np.add.reduceat(second_derivative, window_offsets) / num_windows
+    deviation = second_derivative - avg[segment]
+    std = np.sqrt(np.add.reduceat(deviation * deviation, window_offsets) / num_windows)
+
+    last_age = age[starts[valid] + lengths[valid] - 1]
+    age_cond = (age[rows+2] >= MIN_DERIVATIVE_AGE) & (age[rows+2] < last_age[segment])
+    unconfirmed_cond = age[rows+2] - age[rows] == 2
+    candidates = age_cond & unconfirmed_cond
+
+    upper, lower = avg + 3*std, avg - 3*std
+    three_std_cond = (second_derivative > upper[segment]) | (second_derivative < lower[segment])
+    # segmented sums are not pairwise like np.mean, values within rounding of a threshold are
+    # re-evaluated with the exact per tracklet statistics
+    scale = np.maximum.reduceat(np.abs(second_derivative), window_offsets)[segment]
+    tolerance = 1e-9 * scale
+    borderline = candidates & ((np.abs(second_derivative - upper[segment]) <= tolerance) |
+                               (np.abs(second_derivative - lower[segment]) <= tolerance))
+    for i in np.unique(segment[borderline]):
+        window = slice(window_offsets[i], window_offsets[i] + num_windows[i])
+        values = second_derivative[window]
+        seg_avg, seg_std = np.mean(values), np.std(values)
+        three_std_cond[window] = (values > seg_avg+3*seg_std) | (values < seg_avg-3*seg_std)
+
+    anomaly = candidates & three_std_cond
+    if bounds is not None:
+        lower_bound, upper_bound = (np.asarray(bound, dtype=np.float64)[valid] for bound in bounds)
+        anomaly &= ~((second_derivative >= np.nan_to_num(lower_bound, nan=np.inf)[segment]) &
+                     (second_derivative <= np.nan_to_num(upper_bound, nan=-np.inf)[segment]))
+    hits = np.flatnonzero(anomaly)
+    counts = np.bincount(segment[hits], minlength=len(valid))
+    flags[valid] = counts > 0
+    for i, tracklet_indices in zip(valid, np.split(local[hits], np.cumsum(counts)[:-1])):
+        indices[i] = tracklet_indices
+    return flags, indices
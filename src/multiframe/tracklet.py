@@ -1,57 +1,169 @@
 import os
 import logging
 import numpy as np
-from src.multiframe.smoothness import second_derivative_anomaly
-from src.multiframe.visualisation import plot_tracklet_position, plot_kinematics, plot_bbox_params, plot_derivatives
+import pandas as pd
+from collections import namedtuple
+from src.multiframe.smoothness import second_derivative_anomaly, second_derivative_anomaly_batch, MIN_DERIVATIVE_AGE
+from src.multiframe.physical import MIN_TRACKLET_LENGTH, MAX_WORLD_HEIGHT, MAX_VELOCITY_JUMP, CONVERGENCE_AGE, \
+    physical_anomaly_batch
+from src.multiframe.rendering import PlotJob, render
+from src.multiframe import kernels
+from src.instrumentation import metrics
 
 logger: logging.Logger = logging.getLogger("mf_analyser")
 
+# vectors tested by derivatives_anomaly and the store column holding them
+DERIVATIVE_COLUMNS = {'lat_dist': 'lat_dist', 'long_dist': 'long_dist', 'lat_vel': 'abs_vel_x', 'longi_vel': 'abs_vel_z'}
+# result of a detector on a tracklet, indices and keys of the offending vectors
+AnomalyResult = namedtuple('AnomalyResult', ['flag', 'indices', 'keys'])
+NO_ANOMALY = AnomalyResult(False, {}, [])
+
+
+class _Column:
+    # zero-copy view of a store column over the rows of a tracklet
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, tracklet, owner):
+        if tracklet is None:
+            return self
+        return tracklet._store.column(self.name)[tracklet.offset:tracklet.offset+tracklet.length]
+
+
+class TrackletStore:
+    # one contiguous array per column for the whole log, tracklets are (offset, length) views into it
+    def __init__(self, columns: dict, starts, lengths, rows=None):
+        self.columns = columns
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.rows = rows
+        self._derived = {}
+
+    @classmethod
+    def from_dataframe(cls, df, starts=None, lengths=None):
+        if 'index' in df.columns:
+            rows = df['index'].to_numpy()
+            df = df.drop(['index'], axis=1)
+        else:
+            rows = df.index.to_numpy()
+        columns = {name: df[name].to_numpy() for name in df.columns}
+        if starts is None:
+            starts, lengths = [0], [len(df)]
+        return cls(columns, starts, lengths, rows)
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def num_rows(self):
+        return len(next(iter(self.columns.values())))
+
+    def tracklets(self):
+        return [Tracklet(self, start, length) for start, length in zip(self.starts, self.lengths)]
+
+    def column(self, name):
+        if name in self.columns:
+            return self.columns[name]
+        if name not in self._derived:
+            self._derived[name] = self._derive(name)
+        return self._derived[name]
+
+    def _derive(self, name):
+        if name == 'aspect_ratio':
+            return self.columns['width'] / self.columns['height']
+        if name == 'is_occluded':
+            return np.full(self.num_rows, np.nan)
+        raise KeyError(name)
+
+    def dataframe(self, offset, length):
+        return pd.DataFrame({name: values[offset:offset+length] for name, values in self.columns.items()})
+
 
 class Tracklet:
-    def __init__(self, df):
-        self.df = df
-        self.init()
-
-    def init(self):
-        self.label = self.df.loc[0, 'label']
-        self.sub_class = self.df.loc[0, 'sub_class']
-        self.age = self.df['age'].iloc[-1]
-        self.uid = self.df.loc[0, 'uid']
-        self.frames = self.df['name'].to_numpy()
-        self.scores = self.df['score'].to_numpy()
-        # Kalman tracked parameters
-        self.world_width = self.df['world_width'].to_numpy()
-        self.world_height = self.df['world_height'].to_numpy()
-        self.lat_dist = self.df['lat_dist'].to_numpy()
-        self.long_dist = self.df['long_dist'].to_numpy()
-        self.abs_vel_x = self.df['abs_vel_x'].to_numpy()
-        self.abs_vel_z = self.df['abs_vel_z'].to_numpy()
-        self.abs_acc_x = self.df['abs_acc_x'].to_numpy()
-        self.abs_acc_z = self.df['abs_acc_z'].to_numpy()
-        self.rel_vel_x = self.df['rel_vel_x'].to_numpy()
-        self.rel_vel_z = self.df['rel_vel_z'].to_numpy()
-        self.rel_acc_x = self.df['rel_acc_x'].to_numpy()
-        self.rel_acc_z = self.df['rel_acc_z'].to_numpy()
-        self.orientation = self.df['orientation'].to_numpy()
-        # Derived variables from different logics
-        self.lane_associaation = self.df['lane_association'].to_numpy()
-        self.is_cipv = self.df['is_cipv'].to_numpy()
-        self.is_occluded()
-        # image plane parameters
-        self.x_center = self.df['x_center'].to_numpy()
-        self.y_center = self.df['y_center'].to_numpy()
-        self.width = self.df['width'].to_numpy()
-        self.height = self.df['height'].to_numpy()
-        self.d3_separation = self.df['d3_separation'].to_numpy()
-        self.sf_confirmed = self.df['sf_confirmed'].to_numpy()
-        self.bbox_aspect_ratio()
+    __slots__ = ('_store', 'offset', 'length', 'anomalies')
+
+    frames = _Column('name')
+    ages = _Column('age')
+    scores = _Column('score')
+    # Kalman tracked parameters
+    world_width = _Column('world_width')
+    world_height = _Column('world_height')
+    lat_dist = _Column('lat_dist')
+    long_dist = _Column('long_dist')
+    abs_vel_x = _Column('abs_vel_x')
+    abs_vel_z = _Column('abs_vel_z')
+    abs_acc_x = _Column('abs_acc_x')
+    abs_acc_z = _Column('abs_acc_z')
+    rel_vel_x = _Column('rel_vel_x')
+    rel_vel_z = _Column('rel_vel_z')
+    rel_acc_x = _Column('rel_acc_x')
+    rel_acc_z = _Column('rel_acc_z')
+    orientation = _Column('orientation')
+    # Derived variables from different logics
+    lane_associaation = _Column('lane_association')
+    is_cipv = _Column('is_cipv')
+    is_occluded = _Column('is_occluded')
+    # image plane parameters
+    x_center = _Column('x_center')
+    y_center = _Column('y_center')
+    width = _Column('width')
+    height = _Column('height')
+    d3_separation = _Column('d3_separation')
+    sf_confirmed = _Column('sf_confirmed')
+    aspect_ratio = _Column('aspect_ratio')
+
+    def __init__(self, store: TrackletStore, offset: int = 0, length: int = None):
+        self._store = store
+        self.offset = int(offset)
+        self.length = store.num_rows - self.offset if length is None else int(length)
+        # detector name -> AnomalyResult, filled the first time a detector runs
+        self.anomalies = {}
+
+    @classmethod
+    def from_dataframe(cls, df):
+        return cls(TrackletStore.from_dataframe(df))
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def label(self):
+        return self._store.column('label')[self.offset]
+
+    @property
+    def sub_class(self):
+        return self._store.column('sub_class')[self.offset]
+
+    @property
+    def uid(self):
+        return self._store.column('uid')[self.offset]
+
+    @property
+    def age(self):
+        return self.ages[-1]
+
+    @property
+    def rows(self):
+        # row labels of the tracklet in the source dataframe
+        return self._store.rows[self.offset:self.offset+self.length]
+
+    @property
+    def df(self):
+        # built on demand, tracklets do not hold a dataframe
+        return self._store.dataframe(self.offset, self.length)
 
     def save_graphs(self, path):
-        plot_tracklet_position(self.lat_dist, self.long_dist, path)
-        self._plot_kinematics(path)
-        self._plot_bbox_parameters(path)
+        render(self.graphs_jobs(path))
+
+    def graphs_jobs(self, path):
+        return [PlotJob('plot_tracklet_position', (self.lat_dist, self.long_dist, path)),
+                self._kinematics_job(path),
+                self._bbox_parameters_job(path)]
 
     def _plot_kinematics(self, path):
+        render([self._kinematics_job(path)])
+
+    def _kinematics_job(self, path):
         axis_dict = {'x_axis': {'lat_dist':  {'vector': self.lat_dist, 'units': 'm'},
                                 'abs_vel_x': {'vector': self.abs_vel_x, 'units': 'm/s'},
                                 'abs_acc_x': {'vector': self.abs_acc_x, 'units': 'm/s^2'},
@@ -62,64 +174,77 @@ class Tracklet:
                                 'abs_acc_z': {'vector': self.abs_acc_z, 'units': 'm/s^2'},
                                 'rel_vel_z': {'vector': self.rel_vel_z, 'units': 'm/s'},
                                 'rel_acc_z': {'vector': self.rel_acc_z, 'units': 'm/s^2'}}}
-        x = self.df['age'].to_numpy()
+        x = self.ages
         file_path = os.path.join(path, 'kinematics.png')
-        plot_kinematics(x, axis_dict, file_path)
+        return PlotJob('plot_kinematics', (x, axis_dict, file_path))
 
     def _plot_bbox_parameters(self, path):
+        render([self._bbox_parameters_job(path)])
+
+    def _bbox_parameters_job(self, path):
         params_dict = {'world_width': {'vector': self.world_width, 'units': 'm'},
                        'world_height': {'vector': self.world_height, 'units': 'm'}}
-        x = self.df['age'].to_numpy()
+        x = self.ages
         file_path = os.path.join(path, 'bbox_params.png')
-        plot_bbox_params(x, params_dict, file_path)
+        return PlotJob('plot_bbox_params', (x, params_dict, file_path))
 
     def save_dataframe(self, path):
-        if 'index' in self.df.columns:
-            self.df = self.df.drop(['index'], axis=1)
-        self.df.to_csv(path, sep='\t', index=False)
-
-    def bbox_aspect_ratio(self):
-        self.aspect_ratio = self.width / self.height
-
-    def is_occluded(self):
-        if 'is_occluded' in self.df.columns:
-            self.is_occluded = self.df['is_occluded'].to_numpy()
-        else:
-            self.is_occluded = np.full(len(self.df), np.nan)
+        with metrics.timer('write.tsv'):
+            self.df.to_csv(path, sep='\t', index=False)
+        metrics.count_file(path)
 
     def physical_anomaly(self):
+        if 'physical' not in self.anomalies:
+            self.anomalies['physical'] = self._physical_anomaly()
+            _count_results('physical', [self.anomalies['physical']])
+        return self.anomalies['physical'].flag
+
+    @metrics.timed('detector.physical_anomaly')
+    def _physical_anomaly(self):
         # TODO: consider truncation boxes
         check_functions = {
-            0: self.world_height_anomaly,
-            2: self.longitudinal_velocity_sign_change
+            0: ('world_height', self._world_height_indices),
+            2: ('abs_vel_z', self._longitudinal_velocity_indices)
         }
 
-        check_func = check_functions.get(self.label)
-
-        return len(self.df) >= 5 and (check_func() if check_func else False)
+        key, check_func = check_functions.get(self.label, (None, None))
+        if len(self) < MIN_TRACKLET_LENGTH or check_func is None:
+            return NO_ANOMALY
+        indices = check_func()
+        if not len(indices):
+            return NO_ANOMALY
+        return AnomalyResult(True, {key: indices}, [key])
 
     def longitudinal_velocity_sign_change(self):
-        flag = False
-        idx = max(int(len(self.df) * 0.1),
-                  (self.df['age'] - 10).abs().idxmin())
+        return len(self._longitudinal_velocity_indices()) > 0
+
+    def _longitudinal_velocity_indices(self):
+        # local indices of the rows after a sign change with a jump
+        indices = []
+        idx = max(int(len(self) * 0.1),
+                  np.argmin(np.abs(self.ages - CONVERGENCE_AGE)))
         for i in range(idx, len(self.abs_vel_z)-1):
             curr_vel = self.abs_vel_z[i]
             next_vel = self.abs_vel_z[i+1]
-            if self._sign_difference(curr_vel, next_vel) and abs(next_vel - curr_vel) > 2:
-                flag = True
+            if self._sign_difference(curr_vel, next_vel) and abs(next_vel - curr_vel) > MAX_VELOCITY_JUMP:
+                indices.append(i+1)
                 logger.info(
                     f'Longitudinal velocity anomaly at frame: {self.frames[i+1]} for label:{self.label} ; uid:{self.uid}')
-        return flag
+        return np.array(indices, dtype=np.int64)
 
     def world_height_anomaly(self):
-        idx = int(len(self.df) * 0.1)
+        return len(self._world_height_indices()) > 0
+
+    def _world_height_indices(self):
+        # local indices of the rows above the height threshold
+        idx = int(len(self) * 0.1)
         x = 2*np.std(self.world_height[idx:]) + \
             np.mean(self.world_height[idx:])
-        flag = np.any(self.world_height[idx:] > min(x, 2.2))
-        if flag:
+        indices = idx + np.flatnonzero(self.world_height[idx:] > min(x, MAX_WORLD_HEIGHT))
+        if len(indices):
             logger.info(
                 f'Height anomaly for label:{self.label} ; uid:{self.uid}')
-        return flag
+        return indices
 
     @staticmethod
     def _sign_difference(x, y):
@@ -129,27 +254,163 @@ class Tracklet:
             return False
 
     def derivatives_anomaly(self):
+        if 'derivatives' not in self.anomalies:
+            self.anomalies['derivatives'] = self._derivatives_anomaly()
+            _count_results('derivatives', [self.anomalies['derivatives']])
+        return self.anomalies['derivatives'].flag
+
+    @metrics.timed('detector.derivatives_anomaly')
+    def _derivatives_anomaly(self):
         # TODO: test axis cross correlation
         # TODO: test second derivative auto correlation
         # TODO: consider truncation boxes
         # Apply anomaly detection on object with enough history for Kalman filter to converge
-        if self.age < 10:
-            return False
-        vector_dict = {'lat_dist': self.lat_dist, 'long_dist': self.long_dist, 'lat_vel': self.abs_vel_x, 'longi_vel': self.abs_vel_z}
-        self.vectors_for_plot = {}
-        flags = []
-        for key,x in vector_dict.items():
-            flag, indices = second_derivative_anomaly(x, self.df['age'].to_numpy())
-            flags.append(flag)
+        if self.age < MIN_DERIVATIVE_AGE:
+            return NO_ANOMALY
+        anomaly_indices = {}
+        for key, column in DERIVATIVE_COLUMNS.items():
+            x = self._store.column(column)[self.offset:self.offset+self.length]
+            flag, indices = second_derivative_anomaly(x, self.ages)
             if flag:
-                self.vectors_for_plot[key] = x
+                anomaly_indices[key] = np.array(indices, dtype=np.int64)
                 logger.info(
                     f'Second derivative anomaly at {key} for label:{self.label} with uid:{self.uid} at frame:{self.frames[indices]}')
-        return any(flags)
+        if not anomaly_indices:
+            return NO_ANOMALY
+        return AnomalyResult(True, anomaly_indices, list(anomaly_indices))
+
+    @property
+    def vectors_for_plot(self):
+        keys = self.anomalies['derivatives'].keys if 'derivatives' in self.anomalies else []
+        return {key: self._store.column(DERIVATIVE_COLUMNS[key])[self.offset:self.offset+self.length] for key in keys}
 
     def save_derivatives(self, path):
         os.makedirs(path, exist_ok=True)
+        render(self.derivatives_jobs(path))
+
+    def derivatives_jobs(self, path):
+        jobs = []
         for key, value in self.vectors_for_plot.items():
-            x = self.df['age'].to_numpy()
+            x = self.ages
             file_path = os.path.join(path, f'{key}_derivatives.png')
-            plot_derivatives(x, value, key, file_path)
+            jobs.append(PlotJob('plot_derivatives', (x, value, key, file_path)))
+        return jobs
+
+
+def compute_anomalies(tracklets, fleet=None, cache=None):
+    # fill the detector results of every tracklet in one batched pass per store.
+    # fleet (mf_stats.FleetStats) adds the population thresholds of its (label, sub_class) to the detectors,
+    # cache (mf_results.ResultCache) gives the results of unchanged tracklets and stores the new ones
+    missing = cache.fill(tracklets) if cache is not None else []
+    stores = {}
+    for tracklet in tracklets:
+        stores.setdefault(id(tracklet._store), []).append(tracklet)
+    for group in stores.values():
+        if kernels.USE_NUMBA and fleet is None:
+            _fused_anomaly_batch(group)
+            continue
+        pending = [tracklet for tracklet in group if 'physical' not in tracklet.anomalies]
+        with metrics.timer('detector.physical_anomaly_batch'):
+            caps = None
+            if fleet is not None:
+                # the fleet quantile of the tracklet class replaces MAX_WORLD_HEIGHT when known
+                caps = [MAX_WORLD_HEIGHT if cap is None else cap for cap in _fleet_thresholds(
+                    pending, lambda label, sub_class: fleet.world_height_cap(label, sub_class))]
+            flags, indices = physical_anomaly_batch(pending, caps)
+            _set_physical_results(pending, flags, indices)
+        _count_results('physical', [tracklet.anomalies['physical'] for tracklet in pending])
+
+        pending = [tracklet for tracklet in group if 'derivatives' not in tracklet.anomalies]
+        with metrics.timer('detector.derivatives_anomaly_batch'):
+            _derivatives_anomaly_batch(pending, fleet)
+        _count_results('derivatives', [tracklet.anomalies['derivatives'] for tracklet in pending])
+    if cache is not None:
+        cache.store(missing)
+
+
+def _fused_anomaly_batch(tracklets):
+    # both detectors in one compiled pass, see kernels.py
+    pending = [tracklet for tracklet in tracklets
+               if 'physical' not in tracklet.anomalies or 'derivatives' not in tracklet.anomalies]
+    with metrics.timer('detector.fused_anomaly_batch'):
+        (flags, indices), results = kernels.fused_anomaly_batch(pending, DERIVATIVE_COLUMNS)
+    physical = [i for i, tracklet in enumerate(pending) if 'physical' not in tracklet.anomalies]
+    _set_physical_results([pending[i] for i in physical], flags[physical], [indices[i] for i in physical])
+    _count_results('physical', [pending[i].anomalies['physical'] for i in physical])
+    derivatives = [i for i, tracklet in enumerate(pending) if 'derivatives' not in tracklet.anomalies]
+    _set_derivatives_results([pending[i] for i in derivatives],
+                             {key: (key_flags[derivatives], [key_indices[i] for i in derivatives])
+                              for key, (key_flags, key_indices) in results.items()})
+    _count_results('derivatives', [pending[i].anomalies['derivatives'] for i in derivatives])
+
+
+def _fleet_thresholds(tracklets, threshold):
+    # threshold(label, sub_class) of every tracklet, computed once per group
+    values = {}
+    for tracklet in tracklets:
+        key = (int(tracklet.label), int(tracklet.sub_class))
+        if key not in values:
+            values[key] = threshold(*key)
+    return [values[(int(tracklet.label), int(tracklet.sub_class))] for tracklet in tracklets]
+
+
+def _set_physical_results(tracklets, flags, indices):
+    for tracklet, flag, tracklet_indices in zip(tracklets, flags, indices):
+        key = 'world_height' if tracklet.label == 0 else 'abs_vel_z'
+        tracklet.anomalies['physical'] = AnomalyResult(True, {key: tracklet_indices}, [key]) if flag else NO_ANOMALY
+
+
+def log_result(tracklet, detector, result):
+    # the log lines of the detector for a result computed before, e.g. found in the result cache
+    if not result.flag:
+        return
+    if detector == 'derivatives':
+        for key in result.keys:
+            logger.info(
+                f'Second derivative anomaly at {key} for label:{tracklet.label} with uid:{tracklet.uid} at frame:{tracklet.frames[result.indices[key]]}')
+    elif tracklet.label == 0:
+        logger.info(f'Height anomaly for label:{tracklet.label} ; uid:{tracklet.uid}')
+    else:
+        for i in result.indices['abs_vel_z']:
+            logger.info(
+                f'Longitudinal velocity anomaly at frame: {tracklet.frames[i]} for label:{tracklet.label} ; uid:{tracklet.uid}')
+
+
+def _count_results(detector, results):
+    metrics.count(f'detector.{detector}.tracklets', len(results))
+    metrics.count(f'detector.{detector}.anomalies', sum(result.flag for result in results))
+
+
+def _derivatives_anomaly_batch(tracklets, fleet=None):
+    for tracklet in tracklets:
+        tracklet.anomalies['derivatives'] = NO_ANOMALY
+    # Apply anomaly detection on object with enough history for Kalman filter to converge
+    tracklets = [tracklet for tracklet in tracklets if tracklet.age >= MIN_DERIVATIVE_AGE]
+    if not tracklets:
+        return
+    store = tracklets[0]._store
+    starts = np.array([tracklet.offset for tracklet in tracklets], dtype=np.int64)
+    lengths = np.array([len(tracklet) for tracklet in tracklets], dtype=np.int64)
+    results = {}
+    for key, column in DERIVATIVE_COLUMNS.items():
+        bounds = None
+        if fleet is not None:
+            bounds = np.array([bound or (np.nan, np.nan) for bound in _fleet_thresholds(
+                tracklets, lambda label, sub_class: fleet.second_derivative_bounds(label, sub_class, key))]).T
+        results[key] = second_derivative_anomaly_batch(store.column(column), store.column('age'), starts, lengths,
+                                                       bounds)
+    _set_derivatives_results(tracklets, results)
+
+
+def _set_derivatives_results(tracklets, results):
+    # results: key -> (flags, indices) aligned with tracklets
+    for i, tracklet in enumerate(tracklets):
+        tracklet.anomalies['derivatives'] = NO_ANOMALY
+        anomaly_indices = {}
+        for key, (flags, indices) in results.items():
+            if flags[i]:
+                anomaly_indices[key] = indices[i]
+                logger.info(
+                    f'Second derivative anomaly at {key} for label:{tracklet.label} with uid:{tracklet.uid} at frame:{tracklet.frames[indices[i]]}')
+        if anomaly_indices:
+            tracklet.anomalies['derivatives'] = AnomalyResult(True, anomaly_indices, list(anomaly_indices))
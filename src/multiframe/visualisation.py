@@ -1,5 +1,8 @@
 import os
 import numpy as np
+import matplotlib
+# plots are only saved to files, never shown
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 FIGSIZE = (20, 20)
@@ -99,4 +102,145 @@ def plot_derivatives(age, x, title, file_path):
     ax[2].set_xticks(age)
     plt.tight_layout()
     plt.savefig(file_path)
-    plt.close()
\ No newline at end of file
+    plt.close()
+
+class FigureTemplates:
+    # high throughput plotting: one persistent figure per plot type, its artists are updated with
+    # set_data for every tracklet instead of building a new figure
+    def __init__(self, dpi=None, scale=1.0):
+        self.dpi = dpi
+        self.scale = scale
+        self.templates = {}
+
+    def close(self):
+        for fig, _, _ in self.templates.values():
+            plt.close(fig)
+        self.templates = {}
+
+    def _template(self, name, build):
+        if name not in self.templates:
+            self.templates[name] = build()
+        return self.templates[name]
+
+    def _figure(self, nrows, ncols, figsize=None):
+        figsize = figsize or plt.rcParams['figure.figsize']
+        figsize = (figsize[0] * self.scale, figsize[1] * self.scale)
+        return plt.subplots(nrows, ncols, figsize=figsize, squeeze=False)
+
+    def _save(self, fig, file_path):
+        fig.savefig(file_path, dpi=self.dpi or 'figure')
+
+    @staticmethod
+    def _rescale(ax):
+        ax.relim()
+        ax.autoscale_view()
+
+    def _build_position(self):
+        fig, ax = self._figure(1, 1)
+        ax = ax[0, 0]
+        artists = {'points': ax.plot([], [], 'o', color='blue')[0],
+                   'start': ax.plot([], [], 'o', color='green', label='start')[0],
+                   'end': ax.plot([], [], 'o', color='red', label='end')[0],
+                   'arrows': None}
+        ax.plot(0, 0, 'o', color='black', label='ego_car')
+        ax.legend()
+        ax.grid()
+        ax.set_xlabel('x [m]')
+        ax.set_ylabel('z [m]')
+        ax.set_title('position map')
+        fig.tight_layout()
+        return fig, ax, artists
+
+    def plot_tracklet_position(self, x, z, path):
+        fig, ax, artists = self._template('position', self._build_position)
+        artists['points'].set_data(x, z)
+        artists['start'].set_data(x[:1], z[:1])
+        artists['end'].set_data(x[-1:], z[-1:])
+        # a single quiver replaces one arrow patch per sample
+        if artists['arrows'] is not None:
+            artists['arrows'].remove()
+        artists['arrows'] = ax.quiver(x[:-1], z[:-1], np.diff(x), np.diff(z),
+                                      angles='xy', scale_units='xy', scale=1, width=0.002)
+        self._rescale(ax)
+        self._save(fig, os.path.join(path, 'position_map.png'))
+
+    @staticmethod
+    def _build_variable(ax):
+        artists = {'vector': ax.plot([], [], '--bo')[0],
+                   'mean': ax.axhline(0, label='mean', color='green'),
+                   'upper': ax.axhline(0, label='2*std', color='red', linestyle='dashed'),
+                   'lower': ax.axhline(0, label='2*std', color='red', linestyle='dashed')}
+        ax.grid()
+        return artists
+
+    @staticmethod
+    def _update_variable(ax, artists, x, y, title, units):
+        mean, std = np.mean(y), np.std(y)
+        artists['vector'].set_data(x, y)
+        artists['mean'].set_ydata([mean, mean])
+        artists['upper'].set_ydata([2*std + mean, 2*std + mean])
+        artists['lower'].set_ydata([-2*std + mean, -2*std + mean])
+        # the legend is only rebuilt when the variable shown by the axes changes
+        if artists['vector'].get_label() != title:
+            artists['vector'].set_label(title)
+            ax.legend()
+        ax.set_ylabel(f'[{units}]')
+        FigureTemplates._rescale(ax)
+
+    def _build_grid(self, nrows, ncols):
+        def build():
+            fig, ax = self._figure(nrows, ncols, FIGSIZE)
+            artists = [[self._build_variable(ax[j, i]) for i in range(ncols)] for j in range(nrows)]
+            return fig, ax, artists
+        return build
+
+    def plot_kinematics(self, age, axis_dict: dict, file_path):
+        axes = list(axis_dict.keys())
+        N = len(axes)
+        M = len(axis_dict[axes[0]])
+        fig, ax, artists = self._template(('kinematics', M, N), self._build_grid(M, N))
+        for i in range(N):
+            for j, (key, values) in enumerate(axis_dict[axes[i]].items()):
+                self._update_variable(ax[j, i], artists[j][i], age, values['vector'], key, values['units'])
+        self._save(fig, file_path)
+
+    def plot_bbox_params(self, age, params_dict: dict, file_path):
+        fig, ax, artists = self._template(('bbox_params', len(params_dict)), self._build_grid(len(params_dict), 1))
+        for i, (key, values) in enumerate(params_dict.items()):
+            self._update_variable(ax[i, 0], artists[i][0], age, values['vector'], key, values['units'])
+        self._save(fig, file_path)
+
+    def _build_derivatives(self):
+        fig, ax = self._figure(3, 1, FIGSIZE)
+        ax = ax[:, 0]
+        artists = [{'vector': ax[0].plot([], [], '--bo')[0]}]
+        for axis, style, label in [(ax[1], '--co', 'first derivative'), (ax[2], '--mo', 'second derivative')]:
+            artists.append({'vector': axis.plot([], [], style, label=label)[0],
+                            'mean': axis.axhline(0, label='mean', color='green'),
+                            2: axis.axhline(0, label='2*std', color='red', linestyle='dashed'),
+                            -2: axis.axhline(0, label='2*std', color='red', linestyle='dashed'),
+                            3: axis.axhline(0, label='3*std', color='red', linestyle='dashdot'),
+                            -3: axis.axhline(0, label='3*std', color='red', linestyle='dashdot')})
+            axis.legend(loc='upper left', fontsize='xx-small')
+        for axis in ax:
+            axis.set_xlabel('age')
+            axis.grid(which='both', axis='both')
+        fig.tight_layout()
+        return fig, ax, artists
+
+    def plot_derivatives(self, age, x, title, file_path):
+        fig, ax, artists = self._template('derivatives', self._build_derivatives)
+        artists[0]['vector'].set_data(age, x)
+        if artists[0]['vector'].get_label() != f'{title}':
+            artists[0]['vector'].set_label(f'{title}')
+            ax[0].legend()
+        for n in [1, 2]:
+            derivative = np.diff(x, n=n)
+            avg, std = np.mean(derivative), np.std(derivative)
+            artists[n]['vector'].set_data(age[n:], derivative)
+            artists[n]['mean'].set_ydata([avg, avg])
+            for k in [2, -2, 3, -3]:
+                artists[n][k].set_ydata([k*std + avg, k*std + avg])
+        for axis in ax:
+            self._rescale(axis)
+        self._save(fig, file_path)
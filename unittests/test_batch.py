@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tempfile
+import unittest
+import pandas as pd
+from src.multiframe.mf_batch import run_batch
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.tmp_dir, 'logs')
+        df = pd.read_csv(PATH, sep='\t').head(300)
+        for drive in ['drive_a', 'drive_b']:
+            os.makedirs(os.path.join(self.input_dir, drive))
+            df.to_csv(os.path.join(self.input_dir, drive, 'cametra_interface_output.tsv'), sep='\t', index=False)
+        with open(os.path.join(self.input_dir, 'broken.tsv'), 'w') as f:
+            f.write('not\ta\tcametra\tfile\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_batch_needs_output_dir(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, 'main.py', '--batch', self.input_dir], capture_output=True,
+                                text=True, cwd=root)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn('--output_dir', result.stderr)
+
+    def test_batch(self):
+        output_root = os.path.join(self.tmp_dir, 'output')
+        results = run_batch(self.input_dir, output_root, jobs=2, fast_plots=True, plot_dpi=10, plot_scale=0.2)
+        status = {os.path.relpath(result['file'], self.input_dir): result['status'] for result in results}
+        self.assertEqual(status, {'broken.tsv': 'failed',
+                                  os.path.join('drive_a', 'cametra_interface_output.tsv'): 'ok',
+                                  os.path.join('drive_b', 'cametra_interface_output.tsv'): 'ok'})
+        counts = [result['anomaly_counts'] for result in results if result['status'] == 'ok']
+        self.assertEqual(counts[0], counts[1])
+        for drive in ['drive_a', 'drive_b']:
+            log_path = os.path.join(output_root, drive, 'cametra_interface_output', 'output', 'log.log')
+            self.assertTrue(os.path.exists(log_path))
+        with open(os.path.join(output_root, 'summary.json')) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        summary = pd.read_csv(os.path.join(output_root, 'summary.tsv'), sep='\t')
+        self.assertEqual(len(summary), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from src.multiframe.mf_analyzer import MFAnalyzer
+from src.multiframe.mf_cache import MFCache
+from src.multiframe.mf_parser import MFParser
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cametra_interface_output.tsv')
+        shutil.copy(PATH, self.path)
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _analyzer(self, **kwargs):
+        kwargs.setdefault('cache_dir', self.cache_dir)
+        mfa = MFAnalyzer(self.path, output_dir=self.tmp_dir, **kwargs)
+        mfa.close()
+        return mfa
+
+    def test_cached_tracklets_are_identical(self):
+        uncached = self._analyzer(cache=False)
+        self.assertFalse(os.path.exists(MFCache(self.path, self.cache_dir).cache_dir))
+        self._analyzer()
+        with mock.patch('src.multiframe.mf_analyzer.pd.read_csv') as read_csv:
+            cached = self._analyzer()
+            read_csv.assert_not_called()
+        self.assertIsInstance(cached.store.column('lat_dist'), np.memmap)
+        self.assertEqual(len(uncached), len(cached))
+        for tracklet_uncached, tracklet_cached in zip(uncached.tracklets, cached.tracklets):
+            np.testing.assert_array_equal(tracklet_uncached.rows, tracklet_cached.rows)
+            pd.testing.assert_frame_equal(tracklet_uncached.df, tracklet_cached.df)
+
+    def test_stale_cache(self):
+        self._analyzer()
+        os.utime(self.path, ns=(0, 0))
+        self.assertIsNone(MFCache(self.path, self.cache_dir).load())
+        with mock.patch('src.multiframe.mf_analyzer.MFParser', wraps=MFParser) as parser:
+            self._analyzer()
+            parser.assert_called_once()
+        self.assertIsNotNone(MFCache(self.path, self.cache_dir).load())
+
+    def test_no_cache_dir(self):
+        # nothing is written next to the input without a cache_dir
+        self._analyzer(cache_dir=None)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['cametra_interface_output.tsv', 'output'])
+
+    def test_unwritable_cache(self):
+        with mock.patch('src.multiframe.mf_cache.np.save', side_effect=PermissionError('read only')):
+            with self.assertLogs('mf_analyser', 'WARNING'):
+                mfa = self._analyzer()
+        self.assertGreater(len(mfa), 0)
+        self.assertIsNone(MFCache(self.path, self.cache_dir).load())
+
+    def test_rebuild_cache(self):
+        self._analyzer()
+        with mock.patch('src.multiframe.mf_analyzer.MFParser', wraps=MFParser) as parser:
+            self._analyzer(rebuild_cache=True)
+            parser.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
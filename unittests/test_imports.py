@@ -0,0 +1,69 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+PATH = 'input_files/cametra_interface_output.tsv'
+ROOT = os.path.abspath('..')
+# generous bound on the import of the analysis package, catches eager imports of heavy modules
+IMPORT_BUDGET_US = 2000000
+
+
+def import_times(*args):
+    # module -> cumulative import time in microseconds, from python -X importtime
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args], capture_output=True, text=True, cwd=ROOT,
+                            env={**os.environ, 'PYTHONPATH': ROOT})
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, module = line.split('|')
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_help(self):
+        modules = import_times('main.py', '--help')
+        for module in ['numpy', 'pandas', 'tqdm', 'matplotlib']:
+            self.assertNotIn(module, modules)
+
+    def test_analyzer_import(self):
+        modules = import_times('-c', 'import src.multiframe.mf_batch')
+        self.assertNotIn('matplotlib', modules)
+        self.assertLess(modules['src.multiframe.mf_batch'], IMPORT_BUDGET_US)
+
+    def test_numba_on_use(self):
+        # numba is only imported by the first fused detection
+        result = subprocess.run([sys.executable, '-c', 'import sys, src.multiframe.mf_analyzer; '
+                                 'print("numba" in sys.modules)'], capture_output=True, text=True, cwd=ROOT,
+                                env={**os.environ, 'PYTHONPATH': ROOT})
+        self.assertEqual(result.stdout.strip(), 'False', result.stderr)
+
+    def test_no_plots(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'cametra_interface_output.tsv')
+            shutil.copy(PATH, path)
+            modules = import_times('main.py', '--cametra_path', path, '--output_dir', tmp_dir, '--no_plots',
+                                   '--no_cache')
+            self.assertNotIn('matplotlib', modules)
+            files = [name for _, _, names in os.walk(os.path.join(tmp_dir, 'output')) for name in names]
+            self.assertTrue(any(name.endswith('.tsv') for name in files))
+            self.assertFalse(any(name.endswith('.png') for name in files))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_agg_backend(self):
+        result = subprocess.run([sys.executable, '-c', 'import matplotlib, src.multiframe.visualisation; '
+                                 'print(matplotlib.get_backend())'], capture_output=True, text=True, cwd=ROOT,
+                                env={**os.environ, 'PYTHONPATH': ROOT, 'MPLBACKEND': 'TkAgg'})
+        self.assertEqual(result.stdout.strip().lower(), 'agg')
+
+
+if __name__ == '__main__':
+    unittest.main()
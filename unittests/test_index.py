@@ -0,0 +1,110 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from src.multiframe.mf_analyzer import MFAnalyzer
+from src.multiframe.mf_index import TrackletIndex, FrameIndex
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.mf_stream import MFStreamParser
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestTrackletIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.mfa = MFAnalyzer(PATH, output_dir=cls.tmp_dir, cache=False)
+        cls.mfa.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_label_and_uid(self):
+        for label in [0, 1, 2]:
+            expected = [tracklet for tracklet in self.mfa.tracklets if tracklet.label == label]
+            self.assertEqual(expected, self.mfa.get_tracklets_by_label(label))
+        for uid in {tracklet.uid for tracklet in self.mfa.tracklets}:
+            expected = [tracklet for tracklet in self.mfa.tracklets if tracklet.uid == uid]
+            self.assertEqual(expected, self.mfa.get_tracklets_by_uid(uid))
+
+    def test_labels(self):
+        self.assertEqual(self.mfa.get_labels().tolist(), [0, 1, 2])
+        mfa = MFAnalyzer(PATH, output_dir=self.tmp_dir, cache=False, stream=True)
+        mfa.close()
+        with self.assertRaises(ValueError):
+            mfa.get_labels()
+
+    def test_age_order(self):
+        for label in [0, 1, 2]:
+            tracklets = [tracklet for tracklet in self.mfa.tracklets if tracklet.label == label]
+            ages = [tracklet.age for tracklet in tracklets]
+            self.assertIs(tracklets[ages.index(max(ages))], self.mfa.longest_tracklet_by_label(label))
+            self.assertIs(tracklets[ages.index(min(ages))], self.mfa.shortes_tracklet_by_label(label))
+            self.assertEqual(sorted(ages, reverse=True)[:3],
+                             [tracklet.age for tracklet in self.mfa.top_tracklets_by_label(label, 3)])
+
+    def test_cipv(self):
+        df = pd.read_csv(PATH, sep='\t')
+        df.loc[::50, 'is_cipv'] = 1
+        tracklets = MFParser(df).apply()
+        expected = [tracklet for tracklet in tracklets if tracklet.label == 2 and 1 in tracklet.is_cipv]
+        self.assertTrue(expected)
+        index = TrackletIndex(tracklets)
+        self.assertEqual(expected, index.cipv_tracklets)
+        self.assertEqual(set(expected), index.cipv)
+
+class TestFrameIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.mfa = MFAnalyzer(PATH, output_dir=cls.tmp_dir, cache=False)
+        cls.mfa.close()
+        cls.frames = np.unique(cls.mfa.store.column('name'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def scan(self, first, last):
+        return [tracklet for tracklet in self.mfa.tracklets
+                if min(tracklet.frames) <= last and max(tracklet.frames) >= first]
+
+    def test_tracklets_at(self):
+        for frame in list(self.frames[::7]) + [self.frames[0] - 1, self.frames[-1] + 1]:
+            self.assertEqual(self.scan(frame, frame), self.mfa.tracklets_at(frame))
+
+    def test_tracklets_in(self):
+        for i, j in [(0, 0), (3, 40), (100, 101), (0, len(self.frames) - 1), (200, 337)]:
+            first, last = self.frames[i], self.frames[j]
+            self.assertEqual(self.scan(first, last), self.mfa.tracklets_in((first, last)))
+        # between two frames, only the tracklets spanning both
+        first, last = self.frames[5] + 1, self.frames[6] - 1
+        self.assertEqual(self.scan(first, last), self.mfa.tracklets_in((first, last)))
+
+    def test_rows(self):
+        frames = self.mfa.store.column('name')
+        index = self.mfa.frame_index
+        for frame in self.frames[::11]:
+            np.testing.assert_array_equal(np.flatnonzero(frames == frame), index.rows_at(frame))
+        first, last = self.frames[10], self.frames[20]
+        np.testing.assert_array_equal(np.flatnonzero((frames >= first) & (frames <= last)), index.rows_in(first, last))
+
+    def test_stream_stores(self):
+        # tracklets of many stores, rows are only indexed for a single store
+        tracklets = [tracklet for store in MFStreamParser(PATH, 20, idle_frames=0).stores()
+                     for tracklet in store.tracklets()]
+        self.assertGreater(len({id(tracklet._store) for tracklet in tracklets}), 1)
+        index = FrameIndex(tracklets)
+        frame = self.frames[150]
+        self.assertEqual([tracklet for tracklet in tracklets if min(tracklet.frames) <= frame <= max(tracklet.frames)],
+                         index.tracklets_at(frame))
+        with self.assertRaises(ValueError):
+            index.rows_at(frame)
+        self.assertEqual([], FrameIndex([]).tracklets_at(frame))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from src.instrumentation import Metrics
+from src.multiframe.mf_batch import analyze_file
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestMetrics(unittest.TestCase):
+
+    def test_timers_and_counters(self):
+        metrics = Metrics()
+
+        @metrics.timed('decorated')
+        def function():
+            return 1
+
+        self.assertEqual(function(), 1)
+        self.assertEqual(function(), 1)
+        with metrics.timer('block'):
+            metrics.count('items', 3)
+        metrics.merge({'block': {'calls': 2, 'seconds': 1.0}}, {'items': 2})
+        self.assertEqual(metrics.timers['decorated']['calls'], 2)
+        self.assertEqual(metrics.timers['block']['calls'], 3)
+        self.assertGreaterEqual(metrics.timers['block']['seconds'], 1.0)
+        self.assertEqual(metrics.counters['items'], 5)
+
+
+class TestAnalyzerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cametra_interface_output.tsv')
+        pd.read_csv(PATH, sep='\t').head(300).to_csv(self.path, sep='\t', index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_metrics_json(self):
+        anomaly_counts = analyze_file(self.path, self.tmp_dir, cache=False, fast_plots=True, plot_dpi=10,
+                                      plot_scale=0.2, profile=True, trace_memory=True)
+        output_dir = os.path.join(self.tmp_dir, 'output')
+        with open(os.path.join(output_dir, 'metrics.json')) as f:
+            metrics = json.load(f)
+        for timer in ['load.read_csv', 'load.segmentation', 'stage.physical_anomalies', 'write.tsv']:
+            self.assertIn(timer, metrics['timers'])
+        counters = metrics['counters']
+        self.assertEqual(counters['anomalies.physical_anomalies'], sum(anomaly_counts['physical_anomalies'].values()))
+        outputs = [os.path.join(root, name) for root, _, names in os.walk(output_dir) for name in names
+                   if name.endswith(('.tsv', '.png'))]
+        self.assertEqual(counters['files_written'], len(outputs))
+        self.assertEqual(counters['bytes_written'], sum(os.path.getsize(path) for path in outputs))
+        self.assertGreater(metrics['memory']['peak_mb'], 0)
+        self.assertTrue(os.path.exists(os.path.join(output_dir, 'profile.prof')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import generate_cametra
+from src.multiframe import kernels, physical
+from src.multiframe import tracklet as tracklet_module
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.mf_stream import MFStreamParser
+from src.multiframe.tracklet import DERIVATIVE_COLUMNS, compute_anomalies
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestFusedKernel(unittest.TestCase):
+
+    def assertSameResults(self, tracklets):
+        # fused pass against the per tracklet detectors of Tracklet and smoothness.py
+        (flags, indices), derivatives = kernels.fused_anomaly_batch(tracklets, DERIVATIVE_COLUMNS)
+        for i, tracklet in enumerate(tracklets):
+            physical = tracklet._physical_anomaly()
+            self.assertEqual(flags[i], physical.flag)
+            for key in physical.keys:
+                np.testing.assert_array_equal(indices[i], physical.indices[key])
+            expected = tracklet._derivatives_anomaly()
+            for key, (key_flags, key_indices) in derivatives.items():
+                self.assertEqual(key_flags[i], key in expected.keys)
+                if key in expected.keys:
+                    np.testing.assert_array_equal(key_indices[i], expected.indices[key])
+
+    def test_sample(self):
+        self.assertSameResults(MFParser(pd.read_csv(PATH, sep='\t')).apply())
+
+    def test_synthetic(self):
+        self.assertSameResults(MFParser(generate_cametra(rows=50000, anomaly_rate=0.5, seed=3)).apply())
+
+    def test_float32_store(self):
+        for store in MFStreamParser(PATH, chunksize=400).stores():
+            self.assertSameResults(store.tracklets())
+
+    def test_python_kernel(self):
+        # the kernel source itself, also covered without numba
+        with mock.patch.object(kernels, '_kernel', lambda: kernels._fused_kernel):
+            self.assertSameResults(MFParser(pd.read_csv(PATH, sep='\t')).apply())
+
+    def test_changed_thresholds(self):
+        # thresholds are kernel arguments, a cached compilation follows a change of physical.py
+        tracklets = MFParser(generate_cametra(rows=20000, anomaly_rate=0.5, seed=4)).apply()
+        with mock.patch.multiple(physical, MAX_VELOCITY_JUMP=100, MAX_WORLD_HEIGHT=1.5, MIN_TRACKLET_LENGTH=8), \
+                mock.patch.multiple(tracklet_module, MAX_VELOCITY_JUMP=100, MAX_WORLD_HEIGHT=1.5,
+                                    MIN_TRACKLET_LENGTH=8):
+            self.assertSameResults(tracklets)
+            (flags, _), _ = kernels.fused_anomaly_batch(tracklets, DERIVATIVE_COLUMNS)
+        (default_flags, _), _ = kernels.fused_anomaly_batch(tracklets, DERIVATIVE_COLUMNS)
+        self.assertNotEqual(list(flags), list(default_flags))
+
+    def test_compute_anomalies(self):
+        df = generate_cametra(rows=20000, anomaly_rate=0.5, seed=4)
+        results = {}
+        for use_numba in [False, kernels.HAS_NUMBA]:
+            with mock.patch.object(kernels, 'USE_NUMBA', use_numba):
+                tracklets = MFParser(df).apply()
+                compute_anomalies(tracklets)
+                results[use_numba] = tracklets
+        for numpy_tracklet, tracklet in zip(results[False], results[kernels.HAS_NUMBA]):
+            for detector in ['physical', 'derivatives']:
+                expected, actual = numpy_tracklet.anomalies[detector], tracklet.anomalies[detector]
+                self.assertEqual(expected.keys, actual.keys)
+                for key in expected.keys:
+                    np.testing.assert_array_equal(expected.indices[key], actual.indices[key])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.mf_stream import IDLE_FRAMES
+from src.multiframe.online import OnlineDetector
+from src.multiframe.tracklet import compute_anomalies
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestOnlineDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.read_csv(PATH, sep='\t')
+        rng = np.random.default_rng(1)
+        self.df['abs_vel_z'] += rng.normal(scale=2, size=len(self.df))
+
+    def _online_frames(self, events):
+        frames = {}
+        for event in events:
+            frames.setdefault((event.label, event.uid, event.detector), set()).add(event.frame)
+        return frames
+
+    def test_batch_equivalence(self):
+        tracklets = MFParser(self.df).apply()
+        compute_anomalies(tracklets)
+        online = self._online_frames(OnlineDetector().replay(self.df))
+        agreement = {}
+        for detector in ['physical', 'derivatives']:
+            flags = [(tracklet.anomalies[detector].flag, (tracklet.label, tracklet.uid, detector) in online)
+                     for tracklet in tracklets]
+            agreement[detector] = np.mean([offline == on for offline, on in flags])
+        for tracklet in tracklets:
+            if tracklet.label != 2:
+                continue
+            # the sign change rule only looks at the previous sample, online flags every frame the offline one does
+            indices = tracklet.anomalies['physical'].indices.get('abs_vel_z', [])
+            offline_frames = set(tracklet.frames[indices])
+            self.assertLessEqual(offline_frames, online.get((tracklet.label, tracklet.uid, 'physical'), set()))
+        # derivatives and world height use causal statistics instead of the ones of the whole tracklet
+        self.assertGreater(agreement['physical'], 0.98)
+        self.assertGreater(agreement['derivatives'], 0.85)
+
+    def test_latency(self):
+        # events come out of the update of the frame of their sample
+        detector = OnlineDetector()
+        frames = self.df['name'].to_numpy()
+        boundaries = np.flatnonzero(frames[1:] != frames[:-1]) + 1
+        num_events = 0
+        for rows in np.split(np.arange(len(self.df)), boundaries):
+            frame = self.df.iloc[rows]
+            for event in detector.update(frame):
+                self.assertEqual(event.frame, frame['name'].iloc[0])
+                num_events += 1
+        self.assertGreater(num_events, 0)
+
+    def test_idle_tracks(self):
+        detector = OnlineDetector(idle_frames=2)
+        row = self.df[self.df['label'] == 2].head(1)
+        detector.update(row)
+        self.assertEqual(len(detector.tracks), 1)
+        for _ in range(3):
+            detector.update(row.iloc[:0])
+        self.assertEqual(len(detector.tracks), 0)
+
+    def test_stream_idle_window(self):
+        # a uid is kept over the gaps the stream parser keeps it
+        detector = OnlineDetector()
+        row = self.df[self.df['label'] == 2].head(1)
+        detector.update(row)
+        for _ in range(IDLE_FRAMES):
+            detector.update(row.iloc[:0])
+        self.assertEqual(len(detector.tracks), 1)
+        detector.update(row.iloc[:0])
+        self.assertEqual(len(detector.tracks), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
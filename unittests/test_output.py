@@ -0,0 +1,70 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from src.multiframe.mf_batch import analyze_file
+from src.multiframe.mf_output import HAS_PYARROW
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestTableOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cametra_interface_output.tsv')
+        shutil.copy(PATH, self.path)
+        self.output_dir = os.path.join(self.tmp_dir, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _analyze(self, output_format, table_format='tsv', **kwargs):
+        analyze_file(self.path, self.tmp_dir, cache=False, fast_plots=True, plot_dpi=10, plot_scale=0.2,
+                     output_format=output_format, table_format=table_format, **kwargs)
+
+    def test_deduplicated_table(self):
+        self._analyze('both')
+        table = pd.read_csv(os.path.join(self.output_dir, 'tracklets.tsv'), sep='\t')
+        reasons = pd.read_csv(os.path.join(self.output_dir, 'reasons.tsv'), sep='\t')
+        paths = glob.glob(os.path.join(self.output_dir, '*', '**', 'tracklet_uid_*.tsv'), recursive=True)
+        saved = {}
+        for path in paths:
+            df = pd.read_csv(path, sep='\t')
+            saved[(df['label'][0], df['uid'][0], df['name'][0])] = df
+        # every flagged tracklet is written once, whatever the number of stages flagging it
+        self.assertLess(len(saved), len(paths))
+        self.assertEqual(table['tracklet_id'].nunique(), len(saved))
+        for tracklet_id, rows in table.groupby('tracklet_id'):
+            df = saved[(rows['label'].iloc[0], rows['uid'].iloc[0], rows['name'].iloc[0])]
+            pd.testing.assert_frame_equal(rows.drop(columns=['tracklet_id', 'row']).reset_index(drop=True), df)
+        self.assertTrue(set(reasons['tracklet_id']) <= set(table['tracklet_id']))
+        self.assertEqual(set(reasons['stage']), {'physical_anomalies', 'derivatives_anomalies'})
+        for plot_dir in reasons['plot_dir'].unique():
+            self.assertTrue(os.path.isdir(os.path.join(self.output_dir, plot_dir)))
+
+    def test_table_only(self):
+        self._analyze('table')
+        self.assertEqual(glob.glob(os.path.join(self.output_dir, '*', '**', '*.tsv'), recursive=True), [])
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'tracklets.tsv')))
+        self.assertTrue(glob.glob(os.path.join(self.output_dir, 'physical_anomalies', '**', '*.png'), recursive=True))
+
+    def test_table_without_plots(self):
+        # no per tracklet directory is left behind
+        self._analyze('table', no_plots=True)
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['log.log', 'metrics.json', 'reasons.tsv', 'tracklets.tsv'])
+        reasons = pd.read_csv(os.path.join(self.output_dir, 'reasons.tsv'), sep='\t')
+        self.assertGreater(len(reasons), 0)
+        self.assertTrue(reasons['plot_dir'].isna().all())
+
+    @unittest.skipIf(not HAS_PYARROW, 'pyarrow is not installed')
+    def test_parquet(self):
+        self._analyze('table', 'parquet')
+        table = pd.read_parquet(os.path.join(self.output_dir, 'tracklets.parquet'))
+        reasons = pd.read_parquet(os.path.join(self.output_dir, 'reasons.parquet'))
+        self.assertTrue(set(reasons['tracklet_id']) <= set(table['tracklet_id']))
+        self.assertGreater(len(table), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,5 +27,56 @@ class TestParser(unittest.TestCase):
                 raise AssertionError(f"Duplicate object found")
             seen_objects.add(tracklet)
 
+
+class TestGroupbyParser(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.read_csv(PATH, sep='\t')
+
+    def assertSameSegmentation(self, df):
+        expected = MFParser(df, mode='per_uid').apply()
+        actual = MFParser(df, mode='groupby').apply()
+        self.assertEqual(len(expected), len(actual))
+        for tracklet_expected, tracklet_actual in zip(expected, actual):
+            self.assertEqual(tracklet_expected.label, tracklet_actual.label)
+            self.assertEqual(tracklet_expected.uid, tracklet_actual.uid)
+            np.testing.assert_array_equal(tracklet_expected.rows, tracklet_actual.rows)
+            np.testing.assert_array_equal(tracklet_expected.lat_dist, tracklet_actual.lat_dist)
+
+    def _reused_uid_df(self, ages):
+        # rows of a single uid whose age vector resets according to ages
+        df = self.df[self.df['label'] == 2].head(len(ages)).copy()
+        df['uid'] = 1000
+        df['age'] = ages
+        return pd.concat([self.df, df], ignore_index=True)
+
+    def test_input_file(self):
+        self.assertSameSegmentation(self.df)
+
+    def test_two_tracklets(self):
+        # a single reset drops the last row of the second tracklet
+        df = self._reused_uid_df([1, 2, 3, 4, 1, 2, 3, 4, 5])
+        self.assertSameSegmentation(df)
+        tracklets = [t for t in MFParser(df).apply() if t.uid == 1000]
+        self.assertEqual([len(t) for t in tracklets], [4, 4])
+
+    def test_reset_at_last_row(self):
+        df = self._reused_uid_df([1, 2, 3, 4, 1])
+        self.assertSameSegmentation(df)
+        tracklets = [t for t in MFParser(df).apply() if t.uid == 1000]
+        self.assertEqual([len(t) for t in tracklets], [4])
+
+    def test_multiple_resets(self):
+        df = self._reused_uid_df([1, 2, 3, 1, 2, 1, 2, 3, 4, 5])
+        self.assertSameSegmentation(df)
+        tracklets = [t for t in MFParser(df).apply() if t.uid == 1000]
+        self.assertEqual([len(t) for t in tracklets], [3, 2])
+
+    def test_repeated_age(self):
+        # non positive diff without a reset yields no tracklet
+        df = self._reused_uid_df([1, 2, 2, 3])
+        self.assertSameSegmentation(df)
+        self.assertFalse([t for t in MFParser(df).apply() if t.uid == 1000])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import os
+import time
+import shutil
+import filecmp
+import tempfile
+import unittest
+from src.multiframe.mf_batch import analyze_file
+from src.multiframe.mf_pipeline import produce, WriterPool
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cametra_interface_output.tsv')
+        shutil.copy(PATH, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _analyze(self, name, **kwargs):
+        output_dir = os.path.join(self.tmp_dir, name)
+        counts = analyze_file(self.path, output_dir, cache=False, fast_plots=True, plot_dpi=10, plot_scale=0.2,
+                              **kwargs)
+        return os.path.join(output_dir, 'output'), counts
+
+    def _files(self, output_dir):
+        return sorted(os.path.relpath(os.path.join(root, name), output_dir)
+                      for root, _, names in os.walk(output_dir) for name in names
+                      if name not in ['log.log', 'metrics.json'])
+
+    def assertSameOutput(self, expected, actual):
+        expected_dir, expected_counts = expected
+        actual_dir, actual_counts = actual
+        self.assertEqual(expected_counts, actual_counts)
+        files = self._files(expected_dir)
+        self.assertEqual(files, self._files(actual_dir))
+        for name in files:
+            if name.endswith('.tsv'):
+                self.assertTrue(filecmp.cmp(os.path.join(expected_dir, name), os.path.join(actual_dir, name),
+                                            shallow=False), name)
+
+    def test_same_output_tree(self):
+        self.assertSameOutput(self._analyze('sequential'),
+                              self._analyze('pipeline', pipeline=True, batch_size=5, queue_size=2, writers=3))
+
+    def test_stream(self):
+        self.assertSameOutput(self._analyze('stream', stream=True, chunksize=200),
+                              self._analyze('pipeline', stream=True, chunksize=200, pipeline=True, writers=2))
+
+    def test_back_pressure(self):
+        produced = []
+
+        def batches():
+            for i in range(20):
+                produced.append(i)
+                yield [i]
+
+        for batch in produce(batches(), queue_size=2):
+            time.sleep(0.01)
+            # the queue, the batch being consumed and the one blocked in put
+            self.assertLessEqual(len(produced) - batch[0], 4)
+        self.assertEqual(len(produced), 20)
+
+    def test_producer_error(self):
+        def batches():
+            yield [1]
+            raise ValueError('broken file')
+
+        with self.assertRaises(ValueError):
+            list(produce(batches()))
+
+    def test_writer_error(self):
+        def write(value):
+            if value == 3:
+                raise OSError('disk full')
+
+        writer = WriterPool(threads=2, max_pending=2)
+        for value in range(6):
+            writer.submit(write, value)
+        with self.assertRaises(OSError):
+            writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import threading
+import unittest
+import numpy as np
+from src.multiframe.rendering import PlotJob, Renderer
+
+
+class TestRenderer(unittest.TestCase):
+
+    def _render(self, workers, output_dir, **kwargs):
+        renderer = Renderer(workers, **kwargs)
+        for i in range(4):
+            path = os.path.join(output_dir, str(i))
+            os.makedirs(path)
+            x = np.linspace(0, 1, 5) * i
+            renderer.submit([PlotJob('plot_tracklet_position', (x, x**2, path))])
+        renderer.close()
+        return sorted(os.path.relpath(os.path.join(root, name), output_dir)
+                      for root, _, names in os.walk(output_dir) for name in names)
+
+    def test_pool_writes_same_files(self):
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as pool_dir:
+            expected = self._render(1, serial_dir)
+            self.assertEqual(len(expected), 4)
+            self.assertEqual(expected, self._render(2, pool_dir))
+
+    def test_fast_plots_write_same_files(self):
+        with tempfile.TemporaryDirectory() as serial_dir, tempfile.TemporaryDirectory() as fast_dir:
+            expected = self._render(1, serial_dir)
+            self.assertEqual(expected, self._render(1, fast_dir, fast=True, dpi=30, scale=0.5))
+
+    def test_start_before_threads(self):
+        # the workers are forked by start, a job submitted from another thread reuses them
+        with tempfile.TemporaryDirectory() as output_dir:
+            renderer = Renderer(2)
+            renderer.start()
+            pids = set(renderer.executor._processes)
+            self.assertEqual(len(pids), 2)
+            x = np.linspace(0, 1, 5)
+            thread = threading.Thread(target=renderer.submit,
+                                      args=([PlotJob('plot_tracklet_position', (x, x**2, output_dir))],))
+            thread.start()
+            thread.join()
+            renderer.wait()
+            self.assertEqual(pids, set(renderer.executor._processes))
+            renderer.close()
+            self.assertTrue(os.path.isfile(os.path.join(output_dir, 'position_map.png')))
+
+
+if __name__ == '__main__':
+    unittest.main()
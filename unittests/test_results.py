@@ -0,0 +1,126 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from src.multiframe import physical
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.mf_results import ResultCache
+from src.multiframe.rendering import PlotJob, Renderer
+from src.multiframe.tracklet import compute_anomalies
+from src.instrumentation import metrics
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestResultCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.store = MFParser(pd.read_csv(PATH, sep='\t')).store()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        metrics.reset()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameAnomalies(self, expected, tracklets):
+        for expected_tracklet, tracklet in zip(expected, tracklets):
+            for detector in ['physical', 'derivatives']:
+                expected_result, result = expected_tracklet.anomalies[detector], tracklet.anomalies[detector]
+                self.assertEqual(expected_result.flag, result.flag)
+                self.assertEqual(list(expected_result.keys), list(result.keys))
+                for key in expected_result.keys:
+                    np.testing.assert_array_equal(expected_result.indices[key], result.indices[key])
+
+    def test_detector_results(self):
+        expected = self.store.tracklets()
+        compute_anomalies(expected, cache=ResultCache(self.cache_dir))
+        self.assertEqual(metrics.counters['result_cache.detector_misses'], 2 * len(expected))
+        tracklets = self.store.tracklets()
+        compute_anomalies(tracklets, cache=ResultCache(self.cache_dir))
+        self.assertEqual(metrics.counters['result_cache.detector_hits'], 2 * len(expected))
+        self.assertSameAnomalies(expected, tracklets)
+
+    def test_cached_log(self):
+        # a hit logs the anomalies like the detectors do
+        logs = []
+        for _ in range(2):
+            with self.assertLogs('mf_analyser', 'INFO') as log:
+                compute_anomalies(self.store.tracklets(), cache=ResultCache(self.cache_dir))
+            logs.append(sorted(line for line in log.output if 'anomaly' in line))
+        self.assertTrue(logs[0])
+        self.assertEqual(logs[0], logs[1])
+
+    def test_changed_parameter(self):
+        compute_anomalies(self.store.tracklets(), cache=ResultCache(self.cache_dir))
+        metrics.reset()
+        # only the detector of the parameter runs again
+        with mock.patch.object(physical, 'MAX_VELOCITY_JUMP', 3):
+            cache = ResultCache(self.cache_dir)
+        tracklets = self.store.tracklets()
+        compute_anomalies(tracklets, cache=cache)
+        self.assertEqual(metrics.counters['result_cache.detector_hits'], len(tracklets))
+        self.assertEqual(metrics.counters['result_cache.detector_misses'], len(tracklets))
+        self.assertEqual(metrics.counters['detector.physical.tracklets'], len(tracklets))
+        self.assertEqual(metrics.counters['detector.derivatives.tracklets'], 0)
+
+    def test_changed_tracklet(self):
+        compute_anomalies(self.store.tracklets(), cache=ResultCache(self.cache_dir))
+        columns = dict(self.store.columns)
+        columns['world_height'] = columns['world_height'].copy()
+        tracklet = self.store.tracklets()[0]
+        columns['world_height'][tracklet.offset] += 1
+        store = type(self.store)(columns, self.store.starts, self.store.lengths, self.store.rows)
+        metrics.reset()
+        compute_anomalies(store.tracklets(), cache=ResultCache(self.cache_dir))
+        self.assertEqual(metrics.counters['result_cache.detector_misses'], 2)
+
+    def _render(self, output_dir):
+        renderer = Renderer(cache=ResultCache(self.cache_dir, render_options={}))
+        for i in range(3):
+            x = np.linspace(0, 1, 5) * i
+            os.makedirs(os.path.join(output_dir, str(i)))
+            renderer.submit([PlotJob('plot_tracklet_position', (x, x**2, os.path.join(output_dir, str(i))))])
+        renderer.close()
+        return [os.path.join(output_dir, str(i), 'position_map.png') for i in range(3)]
+
+    def test_plots(self):
+        first = self._render(os.path.join(self.tmp.name, 'first'))
+        metrics.reset()
+        second = self._render(os.path.join(self.tmp.name, 'second'))
+        self.assertEqual(metrics.counters['result_cache.plot_hits'], 3)
+        self.assertNotIn('render.plot_tracklet_position', metrics.timers)
+        for first_path, second_path in zip(first, second):
+            self.assertTrue(os.path.samefile(first_path, second_path))
+        # a rendered plot never writes through a link into the cache
+        cached = os.path.getsize(second[1])
+        Renderer().submit([PlotJob('plot_tracklet_position', (np.arange(50.), np.arange(50.),
+                                                              os.path.dirname(second[1])))])
+        self.assertEqual(cached, os.path.getsize(first[1]))
+        self.assertFalse(os.path.samefile(first[1], second[1]))
+
+    def test_eviction(self):
+        cache = ResultCache(self.cache_dir)
+        tracklets = self.store.tracklets()
+        compute_anomalies(tracklets[:10], cache=cache)
+        old = time.time() - 100
+        for root, _, names in os.walk(cache.cache_dir):
+            for name in names:
+                os.utime(os.path.join(root, name), (old, old))
+        compute_anomalies(tracklets[10:20], cache=cache)
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(cache.cache_dir) for name in names)
+        cache.max_size = size // 2
+        self.assertLessEqual(cache.evict(), size // 2)
+        # the least recently used entries are gone, the new ones are kept
+        metrics.reset()
+        compute_anomalies(self.store.tracklets()[10:20], cache=cache)
+        self.assertEqual(metrics.counters['result_cache.detector_misses'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
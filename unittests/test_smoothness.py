@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+import pandas as pd
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.smoothness import second_derivative_anomaly, second_derivative_anomaly_batch
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestSecondDerivativeBatch(unittest.TestCase):
+
+    def assertSameAnomalies(self, x, age, starts, lengths):
+        flags, indices = second_derivative_anomaly_batch(x, age, starts, lengths)
+        for i, (start, length) in enumerate(zip(starts, lengths)):
+            flag, expected = second_derivative_anomaly(x[start:start+length], age[start:start+length])
+            self.assertEqual(flag, flags[i])
+            self.assertEqual(expected, indices[i].tolist())
+
+    def test_input_file(self):
+        store = MFParser(pd.read_csv(PATH, sep='\t')).store()
+        age = store.column('age')
+        for key in ['lat_dist', 'long_dist', 'abs_vel_x', 'abs_vel_z']:
+            self.assertSameAnomalies(store.column(key), age, store.starts, store.lengths)
+
+    def test_random_tracklets(self):
+        rng = np.random.default_rng(0)
+        lengths = rng.integers(1, 200, 300)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        x = np.cumsum(rng.normal(size=lengths.sum()))
+        # inject spikes and age gaps
+        spikes = rng.integers(0, len(x), 200)
+        x[spikes] += rng.normal(scale=20, size=len(spikes))
+        age = np.concatenate([np.arange(length) + rng.integers(1, 15) for length in lengths])
+        age += np.cumsum(rng.random(len(age)) < 0.05) % 3
+        self.assertSameAnomalies(x, age, starts, lengths)
+
+    def test_borderline_threshold(self):
+        # a single spike among 9 flat samples sits on the 3 sigma threshold up to rounding
+        age = np.arange(10, 22)
+        for spike in [0.1, 0.3, 0.7, 1.0, 1.3, 2.9]:
+            second_derivative = np.zeros(10)
+            second_derivative[4] = spike
+            x = np.cumsum(np.r_[0, np.cumsum(np.r_[0, second_derivative])])
+            self.assertSameAnomalies(x, age, [0], [len(x)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.mf_stats import QuantileSketch, FleetStats, update_fleet_stats, fleet_source
+from src.multiframe.tracklet import compute_anomalies
+from src.multiframe.mf_batch import analyze_file
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_relative_accuracy(self):
+        values = np.random.default_rng(0).normal(0, 5, 100000)
+        sketch = QuantileSketch(0.01)
+        sketch.add(values)
+        for q in [0.005, 0.1, 0.5, 0.9, 0.995]:
+            expected = np.quantile(values, q)
+            self.assertLessEqual(abs(sketch.quantile(q) - expected), 0.01 * abs(expected) + 1e-3)
+
+    def test_merge(self):
+        rng = np.random.default_rng(1)
+        a, b = rng.exponential(1, 5000), -rng.exponential(2, 7000)
+        merged = QuantileSketch()
+        merged.add(a)
+        other = QuantileSketch()
+        other.add(b)
+        merged.merge(other)
+        whole = QuantileSketch()
+        whole.add(np.concatenate([a, b]))
+        self.assertEqual(merged.to_dict(), whole.to_dict())
+
+
+class TestFleetStats(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MFParser(pd.read_csv(PATH, sep='\t')).store()
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'fleet_stats.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_world_height(self):
+        stats = FleetStats()
+        stats.add_store(self.store)
+        # a tracklet belongs to the class of its first row
+        starts, lengths = self.store.starts, self.store.lengths
+        labels, sub_classes = self.store.column('label')[starts], self.store.column('sub_class')[starts]
+        for (label, sub_class, variable), sketch in stats.sketches.items():
+            if variable == 'world_height':
+                self.assertEqual(sketch.count, lengths[(labels == label) & (sub_classes == sub_class)].sum())
+
+    def test_save_load(self):
+        stats = FleetStats()
+        stats.add_store(self.store, 'a')
+        stats.save(self.path)
+        self.assertEqual(FleetStats.load(self.path).to_dict(), stats.to_dict())
+
+    def test_sources_counted_once(self):
+        stats = FleetStats()
+        self.assertTrue(stats.add_store(self.store, 'a'))
+        self.assertFalse(stats.add_store(self.store, 'a'))
+        update_fleet_stats(self.path, [stats])
+        update_fleet_stats(self.path, [stats])
+        self.assertEqual(FleetStats.load(self.path).to_dict(), stats.to_dict())
+        with self.assertRaises(ValueError):
+            FleetStats.load(self.path).merge(stats)
+
+    def test_thresholds(self):
+        stats = FleetStats()
+        stats.add_store(self.store, 'a')
+        fixed = self.store.tracklets()
+        compute_anomalies(fixed)
+        fleet = self.store.tracklets()
+        compute_anomalies(fleet, stats)
+        # the population bounds can only remove second derivative anomalies
+        for fixed_tracklet, fleet_tracklet in zip(fixed, fleet):
+            for key in fleet_tracklet.anomalies['derivatives'].keys:
+                self.assertIn(key, fixed_tracklet.anomalies['derivatives'].keys)
+                self.assertTrue(set(fleet_tracklet.anomalies['derivatives'].indices[key]) <=
+                                set(fixed_tracklet.anomalies['derivatives'].indices[key]))
+
+    def test_analyze_file(self):
+        shutil.copy(PATH, self.tmp)
+        path = os.path.join(self.tmp, os.path.basename(PATH))
+        options = dict(output_dir=self.tmp, cache=False, no_plots=True, fleet_stats=self.path)
+        analyze_file(path, update_fleet_stats=True, **options)
+        stats = FleetStats.load(self.path)
+        self.assertEqual(stats.sources, {fleet_source(path)})
+        counts = analyze_file(path, fleet_thresholds=True, **options)
+        self.assertIsInstance(counts, dict)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import generate_cametra
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.mf_stream import MFStreamParser
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestStreamParser(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.read_csv(PATH, sep='\t')
+
+    def _sorted(self, tracklets):
+        return sorted(tracklets, key=lambda tracklet: (tracklet.label, tracklet.uid, tracklet.frames[0]))
+
+    def assertSameTracklets(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for tracklet_expected, tracklet_actual in zip(self._sorted(expected), self._sorted(actual)):
+            np.testing.assert_array_equal(tracklet_expected.frames, tracklet_actual.frames)
+            np.testing.assert_allclose(tracklet_expected.lat_dist, tracklet_actual.lat_dist, rtol=1e-6)
+            self.assertEqual(tracklet_actual.lat_dist.dtype, np.float32)
+
+    def test_chunk_sizes(self):
+        expected = MFParser(self.df).apply()
+        for chunksize in [1, 13, 500, len(self.df)]:
+            self.assertSameTracklets(expected, list(MFStreamParser(PATH, chunksize)))
+
+    def test_uid_reuse(self):
+        # every negative age diff starts a new tracklet
+        df = self.df[self.df['label'] == 2].head(9).copy()
+        df['uid'] = 1000
+        df['age'] = [1, 2, 3, 4, 1, 2, 3, 4, 5]
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, 'cametra.tsv')
+            pd.concat([self.df, df]).to_csv(path, sep='\t', index=False)
+            tracklets = [tracklet for tracklet in MFStreamParser(path, 4) if tracklet.uid == 1000]
+        self.assertEqual([len(tracklet) for tracklet in tracklets], [4, 5])
+
+    def test_idle_frames(self):
+        # tracklets are closed once their uid is not seen, without losing rows
+        tracklets = list(MFStreamParser(PATH, 20, idle_frames=0))
+        self.assertGreaterEqual(len(tracklets), len(MFParser(self.df).apply()))
+        self.assertEqual(sum(len(tracklet) for tracklet in tracklets), self.df['label'].isin([0, 1, 2]).sum())
+
+    def test_idle_gap(self):
+        # a uid back after more than idle_frames frames starts a new tracklet, in any chunk
+        df = self.df[self.df['label'] == 2].head(1)
+        frames = np.unique(self.df['name'])
+        rows = []
+        for i in [0, 1, 2, 8, 9, 30, 31]:
+            row = df.copy()
+            row['name'] = frames[i]
+            row['age'] = i + 1
+            rows.append(row)
+        gap = pd.concat(rows)
+        gap['uid'] = 1000
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, 'cametra.tsv')
+            pd.concat([self.df, gap]).sort_values('name', kind='stable').to_csv(path, sep='\t', index=False)
+            for chunksize in [7, 100, len(self.df) + len(gap)]:
+                tracklets = [tracklet for tracklet in MFStreamParser(path, chunksize, idle_frames=5)
+                             if tracklet.uid == 1000]
+                self.assertEqual(sorted(len(tracklet) for tracklet in tracklets), [2, 5])
+
+    def test_idle_tracks_released(self):
+        # by default ended tracks are emitted before the end of the file, the open tracks stay few
+        df = generate_cametra(rows=20000, uids=20, tracklet_length=20, uid_reuse=0)
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = os.path.join(output_dir, 'cametra.tsv')
+            df.to_csv(path, sep='\t', index=False)
+            parser = MFStreamParser(path, 500)
+            active, rows, tracklets = [], [], []
+            for store in parser.stores():
+                active.append(len(parser.active))
+                rows.append(store.num_rows)
+                tracklets.extend(store.tracklets())
+        self.assertLess(rows[-1], sum(rows) // 10)
+        self.assertLess(max(active), df['uid'].nunique() // 10)
+        # no track is split by the idle window
+        self.assertEqual(len(tracklets), len(MFParser(df).apply()))
+
+
+if __name__ == '__main__':
+    unittest.main()
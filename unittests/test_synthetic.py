@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from benchmarks.synthetic import generate_cametra
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.mf_stream import CAMETRA_DTYPES
+from src.multiframe.tracklet import compute_anomalies
+
+
+class TestSyntheticCametra(unittest.TestCase):
+
+    def test_columns(self):
+        df = generate_cametra(rows=5000, uids=20)
+        self.assertEqual(len(df), 5000)
+        self.assertEqual(list(df.columns), list(CAMETRA_DTYPES))
+        # rows of a frame are consecutive
+        frames = df['name'].to_numpy()
+        self.assertTrue(np.all(np.diff(frames) >= 0))
+
+    def test_uid_reuse(self):
+        no_reuse = MFParser(generate_cametra(rows=5000, uids=20, uid_reuse=0)).apply()
+        self.assertEqual(len(no_reuse), len({(tracklet.label, tracklet.uid) for tracklet in no_reuse}))
+        reuse = MFParser(generate_cametra(rows=5000, uids=20, uid_reuse=1)).apply()
+        self.assertLess(len({tracklet.uid for tracklet in reuse}), len(reuse))
+        # the reset happens under the label of the uid
+        self.assertEqual(len({tracklet.uid for tracklet in reuse}),
+                         len({(tracklet.label, tracklet.uid) for tracklet in reuse}))
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            generate_cametra(rows=0)
+        with self.assertRaises(ValueError):
+            generate_cametra(uid_reuse=2)
+
+    def test_injected_anomalies(self):
+        df = generate_cametra(rows=20000, uids=20, uid_reuse=0, anomaly_rate=1)
+        tracklets = MFParser(df).apply()
+        compute_anomalies(tracklets)
+        rows = set(df.attrs['injected_rows'])
+        for tracklet in tracklets:
+            if tracklet.label not in [0, 2] or not rows.intersection(tracklet.rows):
+                continue
+            self.assertTrue(tracklet.anomalies['physical'].flag)
+
+
+if __name__ == '__main__':
+    unittest.main()
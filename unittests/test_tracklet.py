@@ -0,0 +1,135 @@
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import generate_cametra
+from src.multiframe.mf_parser import MFParser
+from src.multiframe.physical import physical_anomaly_batch
+from src.multiframe.tracklet import compute_anomalies
+
+PATH = 'input_files/cametra_interface_output.tsv'
+class TestTrackletStore(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.read_csv(PATH, sep='\t')
+        self.store = MFParser(self.df).store()
+        self.tracklets = self.store.tracklets()
+
+    def test_zero_copy_views(self):
+        lat_dist = self.store.column('lat_dist')
+        for tracklet in self.tracklets:
+            self.assertTrue(np.shares_memory(tracklet.lat_dist, lat_dist))
+            self.assertEqual(len(tracklet), len(tracklet.abs_vel_z))
+
+    def test_dataframe_matches_source(self):
+        for tracklet in self.tracklets:
+            expected = self.df.loc[tracklet.rows].reset_index(drop=True)
+            pd.testing.assert_frame_equal(expected, tracklet.df)
+
+    def test_store_covers_rows(self):
+        self.assertEqual(self.store.lengths.sum(), self.store.num_rows)
+
+
+class TestPhysicalAnomalyBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.read_csv(PATH, sep='\t')
+
+    def assertSameAnomalies(self, df):
+        tracklets = MFParser(df).apply()
+        expected = [bool(tracklet.physical_anomaly()) for tracklet in tracklets]
+        flags, indices = physical_anomaly_batch(tracklets)
+        self.assertEqual(expected, flags.tolist())
+        for tracklet, tracklet_indices in zip(tracklets, indices):
+            expected_indices = list(tracklet.anomalies['physical'].indices.values())
+            np.testing.assert_array_equal(expected_indices[0] if expected_indices else [], tracklet_indices)
+        return expected
+
+    def test_input_file(self):
+        self.assertSameAnomalies(self.df)
+
+    def test_noisy_input(self):
+        rng = np.random.default_rng(0)
+        df = self.df.copy()
+        df['abs_vel_z'] = rng.normal(scale=3, size=len(df))
+        df['world_height'] = df['world_height'] + rng.exponential(scale=0.3, size=len(df))
+        expected = self.assertSameAnomalies(df)
+        self.assertTrue(any(expected))
+
+    def test_float32(self):
+        # stream stores hold float32 columns, the batch compares like numpy does in that precision
+        df = generate_cametra(rows=200000, seed=5)
+        df.attrs = {}
+        df = df.astype({column: np.float32 for column in df.columns if df[column].dtype == np.float64})
+        self.assertSameAnomalies(df)
+        df = self.df.astype({'world_height': np.float32})
+        uids = df.loc[df['label'] == 0, 'uid'].unique()[:5]
+        for uid in uids:
+            rows = df.index[(df['label'] == 0) & (df['uid'] == uid)]
+            # values at the cap are not above it, one outlier lifts mean + 2 std beyond the cap
+            df.loc[rows, 'world_height'] = np.float32(2.2)
+            df.loc[rows[-1], 'world_height'] = np.float32(30)
+        self.assertSameAnomalies(df)
+
+    def test_check_functions_return_bool(self):
+        rng = np.random.default_rng(0)
+        df = self.df.copy()
+        df['abs_vel_z'] = rng.normal(scale=3, size=len(df))
+        df['world_height'] = df['world_height'] + rng.exponential(scale=0.3, size=len(df))
+        checks = {0: 'world_height_anomaly', 2: 'longitudinal_velocity_sign_change'}
+        for tracklet in MFParser(df).apply():
+            if tracklet.label in checks and len(tracklet) >= 5:
+                flag = getattr(tracklet, checks[tracklet.label])()
+                self.assertIsInstance(flag, bool)
+                self.assertEqual(flag, tracklet.physical_anomaly())
+
+    def test_label_groups(self):
+        tracklets = MFParser(self.df).apply()
+        for label in [0, 1, 2]:
+            label_tracklets = [tracklet for tracklet in tracklets if tracklet.label == label]
+            expected = [bool(tracklet.physical_anomaly()) for tracklet in label_tracklets]
+            self.assertEqual(expected, physical_anomaly_batch(label_tracklets)[0].tolist())
+
+
+class TestAnomalyCache(unittest.TestCase):
+
+    def setUp(self):
+        df = pd.read_csv(PATH, sep='\t')
+        rng = np.random.default_rng(1)
+        df['abs_vel_z'] = df['abs_vel_z'] + rng.normal(scale=2, size=len(df))
+        self.df = df
+
+    def test_batch_matches_per_tracklet(self):
+        expected = MFParser(self.df).apply()
+        for tracklet in expected:
+            tracklet.physical_anomaly()
+            tracklet.derivatives_anomaly()
+        actual = MFParser(self.df).apply()
+        compute_anomalies(actual)
+        self.assertTrue(any(tracklet.anomalies['derivatives'].flag for tracklet in actual))
+        for tracklet_expected, tracklet_actual in zip(expected, actual):
+            for detector in ['physical', 'derivatives']:
+                result_expected = tracklet_expected.anomalies[detector]
+                result_actual = tracklet_actual.anomalies[detector]
+                self.assertEqual(result_expected.flag, result_actual.flag)
+                self.assertEqual(result_expected.keys, result_actual.keys)
+                for key in result_expected.keys:
+                    np.testing.assert_array_equal(result_expected.indices[key], result_actual.indices[key])
+
+    def test_detectors_run_once(self):
+        tracklets = MFParser(self.df).apply()
+        compute_anomalies(tracklets)
+        with mock.patch('src.multiframe.tracklet.second_derivative_anomaly') as detector:
+            for tracklet in tracklets:
+                self.assertEqual(tracklet.derivatives_anomaly(), tracklet.anomalies['derivatives'].flag)
+                tracklet.physical_anomaly()
+            detector.assert_not_called()
+
+    def test_vectors_for_plot(self):
+        tracklets = MFParser(self.df).apply()
+        compute_anomalies(tracklets)
+        for tracklet in tracklets:
+            self.assertEqual(list(tracklet.vectors_for_plot), tracklet.anomalies['derivatives'].keys)
+
+if __name__ == '__main__':
+    unittest.main()